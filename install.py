@@ -11,6 +11,33 @@ import sys
 import subprocess
 import platform
 
+# Script que se ejecuta con el Python del entorno virtual para descargar en paralelo
+# los recursos de NLTK que todavía no estén instalados
+NLTK_DOWNLOAD_SCRIPT = """
+from concurrent.futures import ThreadPoolExecutor
+import nltk
+
+resources = {
+    "punkt": "tokenizers/punkt",
+    "vader_lexicon": "sentiment/vader_lexicon",
+    "stopwords": "corpora/stopwords",
+}
+
+def is_installed(path):
+    try:
+        nltk.data.find(path)
+        return True
+    except LookupError:
+        return False
+
+missing = [name for name, path in resources.items() if not is_installed(path)]
+if missing:
+    with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+        results = list(executor.map(nltk.download, missing))
+    if not all(results):
+        raise SystemExit("Error al descargar los recursos de NLTK")
+"""
+
 def check_python_version():
     """Verifica que la versión de Python sea compatible."""
     if sys.version_info < (3, 8):
@@ -45,30 +72,22 @@ def create_virtual_environment():
         print("Error al crear el entorno virtual")
         return False
 
+def get_venv_python():
+    """Devuelve la ruta al intérprete de Python del entorno virtual."""
+    if platform.system() == "Windows":
+        return os.path.join(".venv", "Scripts", "python.exe")
+    return os.path.join(".venv", "bin", "python")
+
 def install_dependencies():
     """Instala las dependencias del proyecto en el entorno virtual."""
     print("Instalando dependencias...")
     
-    # Determinar el comando de activación según el sistema operativo
-    if platform.system() == "Windows":
-        activate_cmd = [".venv\\Scripts\\activate.bat"]
-        separator = "&"
-    else:
-        activate_cmd = ["source", ".venv/bin/activate"]
-        separator = "&&"
-    
-    # Construir el comando completo
-    cmd = separator.join([
-        " ".join(activate_cmd),
-        "uv pip install -r requirements.txt",
-        "python -m nltk.downloader punkt vader_lexicon stopwords"
-    ])
+    # uv instala directamente en el entorno virtual indicado, sin necesidad de activarlo
+    venv_python = get_venv_python()
     
     try:
-        if platform.system() == "Windows":
-            subprocess.run(cmd, shell=True, check=True)
-        else:
-            subprocess.run(cmd, shell=True, executable="/bin/bash", check=True)
+        subprocess.run(["uv", "pip", "install", "--python", venv_python, "-r", "requirements.txt"], check=True)
+        subprocess.run([venv_python, "-c", NLTK_DOWNLOAD_SCRIPT], check=True)
         print("✓ Dependencias instaladas correctamente")
         return True
     except subprocess.CalledProcessError:
@@ -79,25 +98,8 @@ def install_ruff():
     """Instala ruff para el linting del código."""
     print("Instalando ruff...")
     
-    # Determinar el comando de activación según el sistema operativo
-    if platform.system() == "Windows":
-        activate_cmd = [".venv\\Scripts\\activate.bat"]
-        separator = "&"
-    else:
-        activate_cmd = ["source", ".venv/bin/activate"]
-        separator = "&&"
-    
-    # Construir el comando completo
-    cmd = separator.join([
-        " ".join(activate_cmd),
-        "uv pip install ruff"
-    ])
-    
     try:
-        if platform.system() == "Windows":
-            subprocess.run(cmd, shell=True, check=True)
-        else:
-            subprocess.run(cmd, shell=True, executable="/bin/bash", check=True)
+        subprocess.run(["uv", "pip", "install", "--python", get_venv_python(), "ruff"], check=True)
         print("✓ ruff instalado correctamente")
         return True
     except subprocess.CalledProcessError:
@@ -7,18 +7,26 @@ Integrado con DuckDB para acceso eficiente al histórico de noticias y seguimien
 """
 
 import os
+import re
+import math
 import json
+import hashlib
+import inspect
+import diskcache
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
 import openai
-import time
+import asyncio
+from aiolimiter import AsyncLimiter
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 import telegram
 import logging
 
 # Importar módulos del proyecto
 from config_manager import config_manager
-from news_database import NewsDatabase
-from openai_cost_tracker import cost_tracker
+from news_database import NewsDatabase, CONTEXT_COLUMNS
+from openai_cost_tracker import get_cost_tracker
 
 # Configurar logging
 logging.basicConfig(
@@ -31,6 +39,106 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Niveles de sentimiento y umbrales superiores (inclusive) de la puntuación para cada nivel
+SENTIMENT_LEVELS = ["muy_malo", "malo", "neutro", "bueno", "muy_bueno"]
+SENTIMENT_THRESHOLDS = np.array([-0.6, -0.2, 0.2, 0.6])
+
+# Periodo de agrupación del contexto histórico según el rango configurado
+CONTEXT_PERIODS = {
+    'week': 'W',
+    'month': 'M',
+    'year': 'M',
+    'all': 'M'
+}
+
+# Palabras clave para extraer manualmente el nivel de sentimiento, compiladas una sola vez
+LEVEL_KEYWORDS = {
+    "muy_malo": ["muy negativo", "muy malo", "muy_malo"],
+    "malo": ["negativo", "malo"],
+    "neutro": ["neutro", "neutral"],
+    "bueno": ["positivo", "bueno"],
+    "muy_bueno": ["muy positivo", "muy bueno", "muy_bueno"]
+}
+LEVEL_PATTERNS = [
+    (level, re.compile('|'.join(re.escape(keyword) for keyword in keywords)))
+    for level, keywords in LEVEL_KEYWORDS.items()
+]
+SCORE_PATTERN = re.compile(r"[-+]?\d*\.\d+|\d+")
+
+# Esquema JSON que debe cumplir la respuesta de ChatGPT (structured outputs)
+SENTIMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "level": {"type": "string", "enum": SENTIMENT_LEVELS},
+        "score": {"type": "number", "minimum": -1.0, "maximum": 1.0},
+        "explanation": {"type": "string"}
+    },
+    "required": ["level", "score", "explanation"],
+    "additionalProperties": False
+}
+
+# Esquema de la respuesta cuando se analizan varias noticias en una misma llamada
+BATCH_SENTIMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                **SENTIMENT_SCHEMA,
+                "properties": {"id": {"type": "integer"}, **SENTIMENT_SCHEMA["properties"]},
+                "required": ["id"] + SENTIMENT_SCHEMA["required"]
+            }
+        }
+    },
+    "required": ["results"],
+    "additionalProperties": False
+}
+
+# Modelos que admiten structured outputs (response_format de tipo json_schema): gpt-4o
+# desde la versión 2024-08-06, gpt-4o-mini y posteriores. El resto recibe json_object
+STRUCTURED_OUTPUT_PREFIXES = ('gpt-4o', 'gpt-4.1', 'gpt-5', 'o1', 'o3', 'o4')
+STRUCTURED_OUTPUT_EXCLUDED = ('gpt-4o-2024-05-13',)
+
+def _response_format_for(model):
+    """
+    Obtiene el formato de respuesta adecuado para un modelo de OpenAI.
+    
+    Args:
+        model (str): Nombre del modelo.
+        
+    Returns:
+        dict: Formato json_schema estricto si el modelo lo admite; json_object si no.
+    """
+    if model.startswith(STRUCTURED_OUTPUT_PREFIXES) and not model.startswith(STRUCTURED_OUTPUT_EXCLUDED):
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": "sentiment_batch", "schema": BATCH_SENTIMENT_SCHEMA, "strict": True}
+        }
+    return {"type": "json_object"}
+
+# Máximo de tokens de respuesta por llamada: límite de salida de gpt-3.5-turbo y gpt-4-turbo,
+# el menor de los modelos admitidos
+MAX_OUTPUT_TOKENS = 4096
+
+# Prompts para ChatGPT (plantillas sin sangría para no enviar tokens de espacios en blanco)
+SYSTEM_PROMPT = "Eres un analista financiero experto que evalúa el impacto de noticias en el precio de las acciones."
+BATCH_PROMPT_TEMPLATE = """Analiza el sentimiento de las siguientes {count} noticias sobre {company_name} ({symbol}) desde la perspectiva de un inversor en el mercado de valores.
+
+{news}
+
+Teniendo en cuenta el contexto histórico proporcionado para cada noticia, clasifica su sentimiento en uno de estos cinco niveles: muy_malo, malo, neutro, bueno, muy_bueno.
+
+Asigna también una puntuación numérica entre -1.0 (muy negativo) y 1.0 (muy positivo).
+
+Explica brevemente por qué cada noticia podría afectar positiva o negativamente al precio de la acción, considerando el contexto histórico cuando sea relevante.
+
+Responde en formato JSON con un campo results que contenga un elemento por noticia con los siguientes campos:
+- id: el número de la noticia
+- level: el nivel de sentimiento (muy_malo, malo, neutro, bueno, muy_bueno)
+- score: la puntuación numérica entre -1.0 y 1.0
+- explanation: explicación breve (máximo 100 palabras)"""
+NEWS_ITEM_TEMPLATE = '{historical_context}\n\nNoticia actual ({date_str}): "{content}"'
+
 class ChatGPTSentimentAnalyzer:
     """Clase para analizar el sentimiento de noticias utilizando ChatGPT con contexto histórico."""
     
@@ -49,23 +157,54 @@ class ChatGPTSentimentAnalyzer:
             logger.warning("API key de OpenAI no configurada. El análisis de sentimiento con ChatGPT no funcionará.")
             self.api_key = None
         
-        # Configurar el modelo de ChatGPT a utilizar
+        # Configurar el modelo de ChatGPT a utilizar y sus parámetros de generación
         self.model = self.openai_config.get('model', "gpt-3.5-turbo")
+        self.temperature = float(self.openai_config.get('temperature', 0.3))
+        self.max_tokens = int(self.openai_config.get('max_tokens', 500))
+        self.response_format = _response_format_for(self.model)
+        
+        # Límite de llamadas a la API en desarrollo
+        self.max_daily_calls = int(self.openai_config.get('max_daily_calls', 100))
         
         # Configurar el rango de contexto histórico
         self.historical_context_range = self.openai_config.get('historical_context_range', "week")
         
+        # Configurar la concurrencia y los reintentos de las llamadas a la API
+        self.concurrency = int(self.openai_config.get('concurrency', 16))
+        self.max_retries = int(self.openai_config.get('max_retries', 5))
+        self.requests_per_minute = int(self.openai_config.get('requests_per_minute', 500))
+        
+        # Número de noticias que se analizan en cada llamada a la API
+        # (sin pasar del límite de tokens de respuesta de una llamada)
+        self.batch_size = max(1, int(self.openai_config.get('batch_size', 5)))
+        if self.batch_size * self.max_tokens > MAX_OUTPUT_TOKENS:
+            self.batch_size = max(1, MAX_OUTPUT_TOKENS // self.max_tokens)
+            logger.warning(f"batch_size reducido a {self.batch_size} para no superar {MAX_OUTPUT_TOKENS} tokens de respuesta por llamada")
+        
+        # Número de empresas que se analizan en paralelo
+        self.company_workers = max(1, min(len(self.companies), 8))
+        
         # Inicializar base de datos
         self.db = NewsDatabase()
         
+        # Caché de noticias de contexto por (símbolo, periodo)
+        self._context_cache = {}
+        
         # Crear directorios necesarios
         self.data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
         self.results_dir = os.path.join(self.data_dir, 'results')
         os.makedirs(self.results_dir, exist_ok=True)
         
+        # Caché persistente de respuestas de ChatGPT (clave SHA-256 de la petición)
+        self.response_cache = diskcache.Cache(os.path.join(self.data_dir, 'chatgpt_cache'))
+        
         # Configurar Telegram si está disponible
         self.telegram_bot = None
         self._setup_telegram()
+        
+        # Los mensajes de Telegram se envían en segundo plano
+        self._telegram_pool = ThreadPoolExecutor(max_workers=2)
+        self._telegram_futures = []
     
     def _setup_telegram(self):
         """Configura el bot de Telegram si está disponible."""
@@ -76,6 +215,7 @@ class ChatGPTSentimentAnalyzer:
            telegram_chat_id and telegram_chat_id != "YOUR_CHAT_ID":
             try:
                 self.telegram_bot = telegram.Bot(token=telegram_token)
+                self.telegram_token = telegram_token
                 self.telegram_chat_id = telegram_chat_id
                 logger.info("Bot de Telegram configurado correctamente")
             except Exception as e:
@@ -95,30 +235,58 @@ class ChatGPTSentimentAnalyzer:
         
         results = {}
         
-        for company in self.companies:
-            symbol = company['symbol']
-            name = company['name']
+        # La instancia puede reutilizarse entre ejecuciones: descartar el contexto anterior
+        self._context_cache = {}
+        
+        # Las empresas son independientes entre sí: analizarlas en paralelo
+        with ThreadPoolExecutor(max_workers=self.company_workers) as executor:
+            futures = {executor.submit(self._analyze_company, company): company for company in self.companies}
             
-            logger.info(f"Analizando sentimiento para {name} ({symbol})...")
+            for future in as_completed(futures):
+                sentiment_data = future.result()
+                if sentiment_data is not None:
+                    results[futures[future]['symbol']] = sentiment_data
+        
+        # Esperar a que terminen los envíos pendientes por Telegram
+        wait(self._telegram_futures)
+        self._telegram_futures = []
+        
+        return results
+    
+    def _analyze_company(self, company):
+        """
+        Analiza el sentimiento para una empresa y envía el resumen por Telegram.
+        
+        Args:
+            company (dict): Información de la empresa (símbolo y nombre).
             
-            try:
-                # Cargar datos combinados
-                combined_data = self._load_combined_data(symbol)
+        Returns:
+            pandas.DataFrame: DataFrame con resultados del análisis, o None si no hay datos.
+        """
+        symbol = company['symbol']
+        name = company['name']
+        
+        logger.info(f"Analizando sentimiento para {name} ({symbol})...")
+        
+        try:
+            # Cargar datos combinados
+            combined_data = self._load_combined_data(symbol)
+            
+            if combined_data is not None and not combined_data.empty:
+                # Analizar sentimiento
+                sentiment_data = self._analyze_sentiment(combined_data, symbol, name)
                 
-                if combined_data is not None and not combined_data.empty:
-                    # Analizar sentimiento
-                    sentiment_data = self._analyze_sentiment(combined_data, symbol, name)
-                    results[symbol] = sentiment_data
-                    
-                    # Enviar resumen por Telegram
-                    self._send_sentiment_summary(sentiment_data, symbol, name)
-                else:
-                    logger.warning(f"No se encontraron datos combinados para {symbol}")
+                # Enviar resumen por Telegram
+                self._send_sentiment_summary(sentiment_data, symbol, name)
                 
-            except Exception as e:
-                logger.error(f"Error al analizar sentimiento para {symbol}: {str(e)}")
+                return sentiment_data
+            else:
+                logger.warning(f"No se encontraron datos combinados para {symbol}")
+            
+        except Exception as e:
+            logger.error(f"Error al analizar sentimiento para {symbol}: {str(e)}")
         
-        return results
+        return None
     
     def _load_combined_data(self, symbol):
         """
@@ -131,14 +299,14 @@ class ChatGPTSentimentAnalyzer:
             pandas.DataFrame: DataFrame con datos combinados.
         """
         processed_dir = os.path.join(self.data_dir, 'processed')
-        file_path = os.path.join(processed_dir, f"{symbol}_combined.csv")
+        file_path = os.path.join(processed_dir, f"{symbol}_combined.parquet")
         
         if not os.path.exists(file_path):
             logger.warning(f"No se encontraron datos combinados para {symbol}")
             return None
         
         # Cargar datos
-        df = pd.read_csv(file_path, index_col=0, parse_dates=True)
+        df = pd.read_parquet(file_path, engine='pyarrow')
         
         return df
     
@@ -162,174 +330,288 @@ class ChatGPTSentimentAnalyzer:
         sentiment_df['sentiment_level'] = 'neutro'
         sentiment_df['sentiment_explanation'] = ''
         
-        # Contador para limitar las llamadas a la API en desarrollo
-        api_calls = 0
-        max_api_calls = self.openai_config.get('max_daily_calls', 100)
+        # Seleccionar solo las filas con contenido, hasta el límite de llamadas (cada llamada analiza un lote)
+        has_content = sentiment_df['content'].str.len().gt(0)
+        work_df = sentiment_df.loc[has_content, ['content']].iloc[:self.max_daily_calls * self.batch_size]
         
-        # Analizar sentimiento solo para filas con contenido
-        for idx, row in sentiment_df.iterrows():
-            if row['content'] and isinstance(row['content'], str) and api_calls < max_api_calls:
-                # Obtener fecha en formato legible
-                current_date = pd.to_datetime(idx)
-                date_str = current_date.strftime('%Y-%m-%d')
-                
-                # Obtener contexto histórico desde la base de datos
-                context_df = self.db.get_historical_context(symbol, current_date, self.historical_context_range)
-                historical_context = self.db.format_context_for_prompt(context_df)
-                
-                # Analizar sentimiento con ChatGPT
-                try:
-                    sentiment_result = self._analyze_with_chatgpt(
-                        row['content'], 
-                        company_name, 
-                        symbol, 
-                        date_str,
-                        historical_context
-                    )
-                    
-                    # Incrementar contador de llamadas a la API
-                    api_calls += 1
-                    
-                    # Guardar resultados
-                    sentiment_df.at[idx, 'chatgpt_score'] = sentiment_result['score']
-                    sentiment_df.at[idx, 'sentiment_level'] = sentiment_result['level']
-                    sentiment_df.at[idx, 'sentiment_explanation'] = sentiment_result['explanation']
-                    
-                    # Esperar para no sobrepasar límites de la API
-                    time.sleep(1)
-                    
-                except Exception as e:
-                    logger.error(f"Error al analizar sentimiento con ChatGPT: {str(e)}")
-                    # Usar valores neutros en caso de error
-                    sentiment_df.at[idx, 'chatgpt_score'] = 0.0
-                    sentiment_df.at[idx, 'sentiment_level'] = 'neutro'
-                    sentiment_df.at[idx, 'sentiment_explanation'] = 'Error en el análisis'
+        # Obtener fechas en formato legible de una sola vez
+        date_strs = work_df.index.strftime('%Y-%m-%d').tolist()
+        
+        # Preparar las filas (y su contexto histórico) que se enviarán a la API
+        pending_rows = []
+        for current_date, content, date_str in zip(work_df.index, work_df['content'].to_numpy(), date_strs):
+            # Obtener contexto histórico (cacheado por periodo)
+            historical_context = self._get_historical_context(symbol, current_date)
+            
+            pending_rows.append((current_date, content, date_str, historical_context))
+        
+        batch_count = math.ceil(len(pending_rows) / self.batch_size)
+        
+        # Analizar sentimiento con ChatGPT lanzando las peticiones de forma concurrente
+        row_results = asyncio.run(self._analyze_rows(pending_rows, company_name, symbol))
+        
+        # Volcar los resultados al DataFrame de una sola vez
+        if row_results:
+            results_df = pd.DataFrame(
+                [result for _, result in row_results],
+                index=[idx for idx, _ in row_results]
+            ).rename(columns={
+                'score': 'chatgpt_score',
+                'level': 'sentiment_level',
+                'explanation': 'sentiment_explanation'
+            })
+            sentiment_df.update(results_df.reindex(columns=['chatgpt_score', 'sentiment_level', 'sentiment_explanation']))
         
         # Guardar resultados
-        results_file_path = os.path.join(self.results_dir, f"{symbol}_sentiment_chatgpt.csv")
-        sentiment_df.to_csv(results_file_path)
+        results_file_path = os.path.join(self.results_dir, f"{symbol}_sentiment_chatgpt.parquet")
+        sentiment_df.to_parquet(results_file_path, engine='pyarrow', compression='zstd')
         
-        logger.info(f"Análisis de sentimiento completado para {symbol}. Realizadas {api_calls} llamadas a la API.")
+        logger.info(f"Análisis de sentimiento completado para {symbol}. Analizadas {len(pending_rows)} noticias en {batch_count} lotes.")
         
         return sentiment_df
     
-    def _analyze_with_chatgpt(self, content, company_name, symbol, date_str, historical_context):
+    def _get_historical_context(self, symbol, current_date):
         """
-        Analiza el sentimiento de una noticia utilizando ChatGPT con contexto histórico.
+        Obtiene el contexto histórico formateado para una fecha.
+        
+        Las noticias se consultan una sola vez por periodo (semana o mes según el
+        rango configurado) y se filtran en memoria para cada fecha concreta.
         
         Args:
-            content (str): Contenido de la noticia.
+            symbol (str): Símbolo de la empresa.
+            current_date (pandas.Timestamp): Fecha de la noticia.
+            
+        Returns:
+            str: Contexto histórico formateado para el prompt.
+        """
+        period = current_date.to_period(CONTEXT_PERIODS.get(self.historical_context_range, 'W'))
+        cache_key = (symbol, period)
+        
+        if cache_key not in self._context_cache:
+            # Cargar todas las noticias que pueden formar parte del contexto de cualquier fecha del periodo
+            start_date = self.db.get_context_start_date(period.start_time, self.historical_context_range)
+            self._context_cache[cache_key] = self.db.get_news_by_date_range(
+                symbol, start_date, (period + 1).start_time, columns=CONTEXT_COLUMNS
+            )
+        
+        period_df = self._context_cache[cache_key]
+        
+        if period_df.empty:
+            return self.db.format_context_for_prompt(period_df)
+        
+        # Mismo criterio que NewsDatabase.get_historical_context: 10 noticias más recientes del rango
+        limit_date = self.db.get_context_start_date(current_date, self.historical_context_range)
+        context_df = period_df[
+            (period_df['published_at'] >= limit_date) & (period_df['published_at'] < current_date)
+        ].head(10)
+        
+        return self.db.format_context_for_prompt(context_df)
+    
+    async def _analyze_rows(self, pending_rows, company_name, symbol):
+        """
+        Analiza de forma concurrente un conjunto de noticias con ChatGPT, agrupándolas en lotes.
+        
+        Args:
+            pending_rows (list): Tuplas (idx, content, date_str, historical_context).
             company_name (str): Nombre de la empresa.
             symbol (str): Símbolo de la empresa.
-            date_str (str): Fecha de la noticia.
-            historical_context (str): Contexto histórico de noticias anteriores.
             
         Returns:
-            dict: Resultado del análisis con puntuación, nivel y explicación.
+            list: Tuplas (idx, resultado) en el mismo orden que pending_rows.
         """
-        # Preparar el prompt para ChatGPT
-        prompt = f"""
-        Analiza el sentimiento de la siguiente noticia sobre {company_name} ({symbol}) del {date_str} 
-        desde la perspectiva de un inversor en el mercado de valores.
+        if not pending_rows:
+            return []
         
-        {historical_context}
+        # Limitar el número de peticiones simultáneas y el ritmo de peticiones por minuto
+        # (el límite de la cuenta se reparte entre las empresas analizadas en paralelo)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        rate_limiter = AsyncLimiter(self.requests_per_minute / self.company_workers, 60)
+        client = openai.AsyncOpenAI(api_key=self.api_key)
         
-        Noticia actual ({date_str}): "{content}"
+        # Las llamadas se registran en el seguimiento de costes de una sola vez al terminar
+        tracking_records = []
         
-        Teniendo en cuenta el contexto histórico proporcionado, clasifica el sentimiento en uno de estos cinco niveles: 
-        muy_malo, malo, neutro, bueno, muy_bueno.
+        async def _analyze_batch(batch):
+            async with semaphore:
+                try:
+                    batch_results = await self._analyze_with_chatgpt(
+                        client,
+                        rate_limiter,
+                        tracking_records,
+                        [(content, date_str, historical_context) for _, content, date_str, historical_context in batch],
+                        company_name,
+                        symbol
+                    )
+                except Exception as e:
+                    logger.error(f"Error al analizar sentimiento con ChatGPT: {str(e)}")
+                    # Usar valores neutros en caso de error
+                    batch_results = [{
+                        "level": "neutro",
+                        "score": 0.0,
+                        "explanation": "Error en el análisis"
+                    } for _ in batch]
+                return [(row[0], result) for row, result in zip(batch, batch_results)]
         
-        Asigna también una puntuación numérica entre -1.0 (muy negativo) y 1.0 (muy positivo).
+        batches = [pending_rows[i:i + self.batch_size] for i in range(0, len(pending_rows), self.batch_size)]
         
-        Explica brevemente por qué la noticia podría afectar positiva o negativamente al precio de la acción,
-        considerando el contexto histórico cuando sea relevante.
+        try:
+            batch_results = await asyncio.gather(*(_analyze_batch(batch) for batch in batches))
+        finally:
+            await client.close()
+            get_cost_tracker().track_request_batch(tracking_records)
         
-        Responde en formato JSON con los siguientes campos:
-        - level: el nivel de sentimiento (muy_malo, malo, neutro, bueno, muy_bueno)
-        - score: la puntuación numérica entre -1.0 y 1.0
-        - explanation: explicación breve (máximo 100 palabras)
+        return [row_result for batch in batch_results for row_result in batch]
+    
+    async def _analyze_with_chatgpt(self, client, rate_limiter, tracking_records, news_rows, company_name, symbol):
         """
+        Analiza el sentimiento de un lote de noticias utilizando ChatGPT con contexto histórico.
         
-        # Realizar la llamada a la API de OpenAI
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
+        Todas las noticias del lote que no estén ya en la caché se envían en una única llamada
+        a la API, que devuelve un resultado por noticia.
         
-        data = {
-            "model": self.model,
-            "messages": [
-                {"role": "system", "content": "Eres un analista financiero experto que evalúa el impacto de noticias en el precio de las acciones."},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": self.openai_config.get('temperature', 0.3),
-            "max_tokens": self.openai_config.get('max_tokens', 500)
-        }
+        Args:
+            client (openai.AsyncOpenAI): Cliente asíncrono de OpenAI.
+            rate_limiter (aiolimiter.AsyncLimiter): Limitador de peticiones por minuto.
+            tracking_records (list): Lista donde se acumulan las llamadas para el seguimiento de costes.
+            news_rows (list): Tuplas (content, date_str, historical_context) de cada noticia.
+            company_name (str): Nombre de la empresa.
+            symbol (str): Símbolo de la empresa.
+            
+        Returns:
+            list: Resultados del análisis (puntuación, nivel y explicación) en el orden de news_rows.
+        """
+        # Preparar el texto de cada noticia con su contexto histórico
+        news_items = [
+            NEWS_ITEM_TEMPLATE.format(date_str=date_str, historical_context=historical_context, content=content)
+            for content, date_str, historical_context in news_rows
+        ]
+        
+        # Reutilizar los resultados de las noticias que ya se analizaron con la misma petición
+        cache_keys = [
+            hashlib.sha256(
+                json.dumps(
+                    [self.model, SYSTEM_PROMPT, BATCH_PROMPT_TEMPLATE, company_name, symbol, news_item],
+                    ensure_ascii=False
+                ).encode('utf-8')
+            ).hexdigest()
+            for news_item in news_items
+        ]
+        results = [self.response_cache.get(cache_key) for cache_key in cache_keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        
+        if not missing:
+            return results
+        
+        # Preparar el prompt para ChatGPT con las noticias pendientes numeradas
+        prompt = BATCH_PROMPT_TEMPLATE.format(
+            company_name=company_name,
+            symbol=symbol,
+            count=len(missing),
+            news="\n\n".join(
+                f"### Noticia {number}\n{news_items[i]}" for number, i in enumerate(missing, 1)
+            )
+        )
         
-        openai.api_key = self.api_key
-        response = openai.ChatCompletion.create(
-        model=self.model,
-        messages=messages,
-        temperature=self.openai_config.get('temperature', 0.3),
-        max_tokens=self.openai_config.get('max_tokens', 500)
-)
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+        
+        # Fecha de referencia del lote para el seguimiento de costes
+        date_str = news_rows[missing[0]][1]
         
-        if response.status_code != 200:
-            logger.error(f"Error en la API de OpenAI: {response.status_code} - {response.text}")
+        # Realizar la llamada a la API de OpenAI (reintentando si se alcanza el límite de peticiones)
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with rate_limiter:
+                        response = await client.chat.completions.create(
+                            model=self.model,
+                            messages=messages,
+                            temperature=self.temperature,
+                            # El límite de tokens de respuesta se aplica por noticia
+                            max_tokens=min(self.max_tokens * len(missing), MAX_OUTPUT_TOKENS),
+                            response_format=self.response_format
+                        )
+                    break
+                except openai.RateLimitError as e:
+                    if attempt == self.max_retries:
+                        raise
+                    # Respetar el tiempo de espera indicado por la API (o espera exponencial)
+                    retry_after = e.response.headers.get('retry-after')
+                    await asyncio.sleep(float(retry_after) if retry_after else 2 ** attempt)
+        except openai.OpenAIError as e:
+            logger.error(f"Error en la API de OpenAI: {str(e)}")
             # Registrar error en el seguimiento de costes
-            cost_tracker.track_request(
-                prompt=prompt,
-                completion="Error: " + response.text,
-                model=self.model,
-                symbol=symbol,
-                news_date=datetime.strptime(date_str, '%Y-%m-%d') if date_str else None,
-                status="error"
-            )
-            raise Exception(f"Error en la API de OpenAI: {response.status_code}")
+            tracking_records.append({
+                'prompt': prompt,
+                'completion': "Error: " + str(e),
+                'model': self.model,
+                'symbol': symbol,
+                'news_date': datetime.strptime(date_str, '%Y-%m-%d') if date_str else None,
+                'timestamp': datetime.now(),
+                'status': "error"
+            })
+            raise Exception(f"Error en la API de OpenAI: {str(e)}")
         
         # Extraer la respuesta
-        response_data = response.json()
-        response_text = response_data['choices'][0]['message']['content']
+        response_text = response.choices[0].message.content
         
         # Registrar la llamada en el seguimiento de costes
-        cost_tracker.track_request(
-            prompt=prompt,
-            completion=response_text,
-            model=self.model,
-            symbol=symbol,
-            news_date=datetime.strptime(date_str, '%Y-%m-%d') if date_str else None,
-            status="success"
-        )
-        
-        # Intentar parsear la respuesta como JSON
+        tracking_records.append({
+            'prompt': prompt,
+            'completion': response_text,
+            'model': self.model,
+            'symbol': symbol,
+            'news_date': datetime.strptime(date_str, '%Y-%m-%d') if date_str else None,
+            'timestamp': datetime.now(),
+            'status': "success"
+        })
+        
+        # Parsear la respuesta (con json_schema la API garantiza que se ajusta a
+        # BATCH_SENTIMENT_SCHEMA; con json_object solo que es JSON válido)
         try:
-            # Extraer solo la parte JSON de la respuesta
-            json_start = response_text.find('{')
-            json_end = response_text.rfind('}') + 1
+            # Sin esquema (json_object) el modelo puede devolver el id como texto ("1")
+            parsed_results = {int(item['id']): item for item in json.loads(response_text)['results']}
+        except json.JSONDecodeError:
+            # Respuesta truncada o inválida: con una sola noticia, intentar extraer la información manualmente
+            parsed_results = {1: self._extract_sentiment_manually(response_text)} if len(missing) == 1 else {}
+        except (KeyError, TypeError, ValueError):
+            parsed_results = {}
+        
+        expected_ids = set(range(1, len(missing) + 1))
+        if parsed_results and set(parsed_results) != expected_ids:
+            logger.warning(
+                f"Los ids de la respuesta de ChatGPT no coinciden con el lote de {symbol}: "
+                f"esperados {sorted(expected_ids)}, recibidos {sorted(parsed_results)}"
+            )
+        
+        for number, i in enumerate(missing, 1):
+            result = parsed_results.get(number)
             
-            if json_start >= 0 and json_end > json_start:
-                json_str = response_text[json_start:json_end]
-                result = json.loads(json_str)
-            else:
-                # Si no se encuentra formato JSON, intentar extraer la información manualmente
-                result = self._extract_sentiment_manually(response_text)
-                
             # Verificar que los campos necesarios estén presentes
-            if 'level' not in result or 'score' not in result:
-                raise ValueError("Respuesta incompleta")
+            if not isinstance(result, dict) or 'level' not in result or 'score' not in result:
+                logger.error(f"Error al parsear respuesta de ChatGPT para la noticia {number} del lote")
+                logger.error(f"Respuesta recibida: {response_text}")
                 
-            return result
-            
-        except Exception as e:
-            logger.error(f"Error al parsear respuesta de ChatGPT: {str(e)}")
-            logger.error(f"Respuesta recibida: {response_text}")
+                # Usar un resultado por defecto en caso de error
+                results[i] = {
+                    "level": "neutro",
+                    "score": 0.0,
+                    "explanation": "No se pudo analizar la respuesta de ChatGPT."
+                }
+                continue
             
-            # Devolver un resultado por defecto en caso de error
-            return {
-                "level": "neutro",
-                "score": 0.0,
-                "explanation": "No se pudo analizar la respuesta de ChatGPT."
+            results[i] = {
+                "level": result['level'],
+                "score": result['score'],
+                "explanation": result.get('explanation', '')
             }
+            
+            # Guardar en caché solo las respuestas válidas
+            self.response_cache.set(cache_keys[i], results[i])
+        
+        return results
     
     def _extract_sentiment_manually(self, text):
         """
@@ -348,25 +630,15 @@ class ChatGPTSentimentAnalyzer:
             "explanation": ""
         }
         
-        # Buscar nivel de sentimiento
-        level_keywords = {
-            "muy_malo": ["muy negativo", "muy malo", "muy_malo"],
-            "malo": ["negativo", "malo"],
-            "neutro": ["neutro", "neutral"],
-            "bueno": ["positivo", "bueno"],
-            "muy_bueno": ["muy positivo", "muy bueno", "muy_bueno"]
-        }
-        
-        for level, keywords in level_keywords.items():
-            for keyword in keywords:
-                if keyword in text.lower():
-                    result["level"] = level
-                    break
+        # Buscar nivel de sentimiento (prevalece el último nivel de la lista con coincidencias)
+        text_lower = text.lower()
+        for level, pattern in reversed(LEVEL_PATTERNS):
+            if pattern.search(text_lower):
+                result["level"] = level
+                break
         
         # Buscar puntuación
-        import re
-        score_matches = re.findall(r"[-+]?\d*\.\d+|\d+", text)
-        for match in score_matches:
+        for match in SCORE_PATTERN.findall(text):
             try:
                 score = float(match)
                 if -1.0 <= score <= 1.0:
@@ -378,11 +650,13 @@ class ChatGPTSentimentAnalyzer:
         # Extraer explicación
         explanation_markers = ["explicación:", "explanation:", "porque", "ya que", "debido a"]
         for marker in explanation_markers:
-            if marker in text.lower():
-                parts = text.lower().split(marker)
-                if len(parts) > 1:
-                    result["explanation"] = parts[1].strip()[:200]  # Limitar a 200 caracteres
-                    break
+            start = text_lower.find(marker)
+            if start >= 0:
+                # Texto entre el marcador y su siguiente aparición, conservando mayúsculas
+                start += len(marker)
+                end = text_lower.find(marker, start)
+                result["explanation"] = text[start:end if end >= 0 else None].strip()[:200]  # Limitar a 200 caracteres
+                break
         
         if not result["explanation"]:
             # Si no se encuentra un marcador específico, tomar el último párrafo
@@ -409,67 +683,104 @@ class ChatGPTSentimentAnalyzer:
             # Obtener datos recientes (últimos 7 días)
             recent_data = sentiment_df.iloc[-7:]
             
-            # Contar ocurrencias de cada nivel de sentimiento
-            sentiment_counts = recent_data['sentiment_level'].value_counts()
+            # Contar ocurrencias de cada nivel de sentimiento (0 para los niveles ausentes)
+            sentiment_counts = recent_data['sentiment_level'].value_counts().reindex(SENTIMENT_LEVELS, fill_value=0)
             
             # Calcular sentimiento promedio
             avg_sentiment = recent_data['chatgpt_score'].mean()
             
             # Determinar el nivel general basado en el promedio
-            if avg_sentiment <= -0.6:
-                overall_sentiment = "muy_malo"
-            elif avg_sentiment <= -0.2:
-                overall_sentiment = "malo"
-            elif avg_sentiment <= 0.2:
-                overall_sentiment = "neutro"
-            elif avg_sentiment <= 0.6:
-                overall_sentiment = "bueno"
-            else:
-                overall_sentiment = "muy_bueno"
-            
-            # Crear mensaje
-            message = f"📊 *Análisis de Sentimiento con ChatGPT para {company_name} ({symbol})*\n\n"
-            message += f"Sentimiento general: {self._translate_sentiment(overall_sentiment)}\n"
-            message += f"Puntuación promedio: {avg_sentiment:.2f}\n\n"
+            overall_sentiment = SENTIMENT_LEVELS[np.searchsorted(SENTIMENT_THRESHOLDS, avg_sentiment)]
             
-            message += "Distribución de sentimiento (últimos 7 días):\n"
-            for level in ["muy_bueno", "bueno", "neutro", "malo", "muy_malo"]:
-                count = sentiment_counts.get(level, 0)
-                message += f"- {self._translate_sentiment(level)}: {count}\n"
+            # Crear mensaje línea a línea
+            lines = [
+                f"📊 *Análisis de Sentimiento con ChatGPT para {company_name} ({symbol})*",
+                "",
+                f"Sentimiento general: {self._translate_sentiment(overall_sentiment)}",
+                f"Puntuación promedio: {avg_sentiment:.2f}",
+                "",
+                "Distribución de sentimiento (últimos 7 días):"
+            ]
+            lines.extend(
+                f"- {self._translate_sentiment(level)}: {sentiment_counts[level]}"
+                for level in reversed(SENTIMENT_LEVELS)
+            )
             
             # Tendencia de precio
             if 'close' in recent_data.columns:
                 price_change = (recent_data['close'].iloc[-1] / recent_data['close'].iloc[0] - 1) * 100
-                message += f"\nCambio de precio (7 días): {price_change:.2f}%\n"
+                lines += ["", f"Cambio de precio (7 días): {price_change:.2f}%"]
             
             # Predicción basada en sentimiento
-            message += f"\nPredicción basada en sentimiento: {self._get_prediction(overall_sentiment)}"
+            lines += ["", f"Predicción basada en sentimiento: {self._get_prediction(overall_sentiment)}"]
             
             # Añadir explicación de la noticia más reciente con sentimiento
             recent_with_explanation = recent_data[recent_data['sentiment_explanation'] != '']
             if not recent_with_explanation.empty:
                 latest = recent_with_explanation.iloc[-1]
-                message += f"\n\n*Última noticia analizada ({latest.name.strftime('%Y-%m-%d')}):*\n"
-                message += f"Sentimiento: {self._translate_sentiment(latest['sentiment_level'])}\n"
-                message += f"Explicación: {latest['sentiment_explanation']}"
+                lines += [
+                    "",
+                    f"*Última noticia analizada ({latest.name.strftime('%Y-%m-%d')}):*",
+                    f"Sentimiento: {self._translate_sentiment(latest['sentiment_level'])}",
+                    f"Explicación: {latest['sentiment_explanation']}"
+                ]
             
             # Añadir información de costes
-            total_cost = cost_tracker.get_total_cost()
-            message += f"\n\n*Información de costes de OpenAI:*\n"
-            message += f"Coste total acumulado: ${total_cost:.4f} USD"
+            total_cost = get_cost_tracker().get_total_cost()
+            lines += [
+                "",
+                "*Información de costes de OpenAI:*",
+                f"Coste total acumulado: ${total_cost:.4f} USD"
+            ]
             
-            # Enviar mensaje
-            self.telegram_bot.send_message(
-                chat_id=self.telegram_chat_id,
-                text=message,
-                parse_mode='Markdown'
-            )
+            message = "\n".join(lines)
             
-            logger.info(f"Resumen de sentimiento enviado por Telegram para {symbol}")
+            # Enviar mensaje en segundo plano para no bloquear el análisis de la siguiente empresa
+            future = self._telegram_pool.submit(self._send_telegram_message, message)
+            future.add_done_callback(lambda f: self._log_telegram_result(f, symbol))
+            self._telegram_futures.append(future)
             
         except Exception as e:
             logger.error(f"Error al enviar resumen por Telegram: {str(e)}")
     
+    def _send_telegram_message(self, text):
+        """
+        Envía un mensaje por Telegram y espera a que termine el envío.
+        
+        Se ejecuta en el pool de Telegram. Desde python-telegram-bot 20 send_message es
+        una corrutina: se ejecuta en un bucle propio con un bot nuevo, ya que su cliente
+        HTTP queda ligado al bucle de eventos y los envíos pueden ir en paralelo.
+        
+        Args:
+            text (str): Mensaje en formato Markdown.
+            
+        Returns:
+            telegram.Message: Mensaje enviado.
+        """
+        if not inspect.iscoroutinefunction(telegram.Bot.send_message):
+            # python-telegram-bot < 20: API síncrona
+            return self.telegram_bot.send_message(chat_id=self.telegram_chat_id, text=text, parse_mode='Markdown')
+        
+        async def send():
+            async with telegram.Bot(token=self.telegram_token) as bot:
+                return await bot.send_message(chat_id=self.telegram_chat_id, text=text, parse_mode='Markdown')
+        
+        return asyncio.run(send())
+    
+    def _log_telegram_result(self, future, symbol):
+        """
+        Registra el resultado del envío en segundo plano de un resumen por Telegram.
+        
+        Args:
+            future (concurrent.futures.Future): Envío del mensaje.
+            symbol (str): Símbolo de la empresa.
+        """
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Error al enviar resumen por Telegram: {str(error)}")
+        else:
+            logger.info(f"Resumen de sentimiento enviado por Telegram para {symbol}")
+    
     def _translate_sentiment(self, sentiment_level):
         """
         Traduce el nivel de sentimiento a un formato más legible.
@@ -516,5 +827,5 @@ if __name__ == "__main__":
     sentiment_results = analyzer.analyze_all_companies()
     
     # Generar informe de costes
-    cost_report = cost_tracker.generate_cost_report()
+    cost_report = get_cost_tracker().generate_cost_report()
     print(f"Informe de costes generado en: {cost_report}")
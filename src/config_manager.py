@@ -9,18 +9,20 @@ Proporciona una interfaz unificada para acceder a todas las configuraciones del
 import os
 import yaml
 import logging
+from functools import lru_cache, cached_property
 
-# Configurar logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("config_manager.log"),
-        logging.StreamHandler()
-    ]
-)
+# Usar el cargador de YAML en C (libyaml) si está disponible
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# Logger del módulo; su archivo de log se configura al crear el primer ConfigManager
 logger = logging.getLogger(__name__)
 
+# Caché de archivos YAML ya parseados, por (ruta, fecha de modificación, tamaño)
+_YAML_CACHE = {}
+
 class ConfigManager:
     """Clase para gestionar la configuración y credenciales del proyecto."""
     
@@ -41,6 +43,8 @@ class ConfigManager:
         else:
             self.config_dir = config_dir
         
+        self._setup_logging()
+        
         # Rutas a los archivos de configuración
         self.config_path = os.path.join(self.config_dir, 'config.yaml')
         self.credentials_path = os.path.join(self.config_dir, 'credentials.yaml')
@@ -57,6 +61,30 @@ class ConfigManager:
         if not self.credentials:
             logger.warning(f"No se pudo cargar las credenciales desde {self.credentials_path}")
             self.credentials = {}
+        
+        # Índice plano de credenciales por (sección, clave) para accesos con una sola búsqueda
+        self._flat_credentials = {
+            (section, key): value
+            for section, values in self.credentials.items() if isinstance(values, dict)
+            for key, value in values.items()
+        }
+    
+    def _setup_logging(self):
+        """
+        Añade el archivo de log del gestor de configuración si aún no está configurado.
+        
+        El archivo se crea junto al directorio de configuración y solo se abre
+        al escribir el primer mensaje.
+        """
+        if logger.handlers:
+            return
+        
+        log_path = os.path.join(os.path.dirname(os.path.abspath(self.config_dir)), 'config_manager.log')
+        handler = logging.FileHandler(log_path, delay=True)
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
     
     def _load_yaml(self, file_path):
         """
@@ -70,8 +98,15 @@ class ConfigManager:
         """
         try:
             if os.path.exists(file_path):
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    return yaml.safe_load(file)
+                # Reutilizar el contenido parseado mientras el archivo no cambie
+                stat = os.stat(file_path)
+                cache_key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+                
+                if cache_key not in _YAML_CACHE:
+                    with open(file_path, 'r', encoding='utf-8') as file:
+                        _YAML_CACHE[cache_key] = yaml.load(file, Loader=SafeLoader)
+                
+                return _YAML_CACHE[cache_key]
             else:
                 logger.error(f"El archivo {file_path} no existe")
                 return {}
@@ -94,16 +129,15 @@ class ConfigManager:
         if section is None:
             return self.config
         
-        if section not in self.config:
+        section_config = self.config.get(section)
+        
+        if section_config is None:
             return default
         
         if key is None:
-            return self.config[section]
-        
-        if key not in self.config[section]:
-            return default
+            return section_config
         
-        return self.config[section][key]
+        return section_config.get(key, default)
     
     def get_credential(self, section, key=None, default=None):
         """
@@ -117,16 +151,10 @@ class ConfigManager:
         Returns:
             El valor de la credencial, o el valor por defecto si no se encuentra.
         """
-        if section not in self.credentials:
-            return default
-        
         if key is None:
-            return self.credentials[section]
-        
-        if key not in self.credentials[section]:
-            return default
+            return self.credentials.get(section, default)
         
-        return self.credentials[section][key]
+        return self._flat_credentials.get((section, key), default)
     
     def get_companies(self):
         """
@@ -137,6 +165,46 @@ class ConfigManager:
         """
         return self.config.get('companies', [])
     
+    @cached_property
+    def database_config(self):
+        """
+        Configuración de la base de datos, calculada una sola vez.
+        
+        Returns:
+            dict: Configuración de la base de datos.
+        """
+        return self.config.get('database', {'type': 'duckdb', 'filename': 'news_database.duckdb'})
+    
+    @cached_property
+    def openai_config(self):
+        """
+        Configuración de OpenAI, calculada una sola vez.
+        
+        Returns:
+            dict: Configuración de OpenAI.
+        """
+        return self.credentials.get('openai', {})
+    
+    @cached_property
+    def telegram_config(self):
+        """
+        Configuración de Telegram, calculada una sola vez.
+        
+        Returns:
+            dict: Configuración de Telegram.
+        """
+        return self.credentials.get('telegram', {})
+    
+    @cached_property
+    def news_api_config(self):
+        """
+        Configuración de la API de noticias, calculada una sola vez.
+        
+        Returns:
+            dict: Configuración de la API de noticias.
+        """
+        return self.credentials.get('news_api', {})
+    
     def get_database_config(self):
         """
         Obtiene la configuración de la base de datos.
@@ -144,7 +212,7 @@ class ConfigManager:
         Returns:
             dict: Configuración de la base de datos.
         """
-        return self.config.get('database', {'type': 'duckdb', 'filename': 'news_database.duckdb'})
+        return self.database_config
     
     def get_openai_config(self):
         """
@@ -153,7 +221,7 @@ class ConfigManager:
         Returns:
             dict: Configuración de OpenAI.
         """
-        return self.credentials.get('openai', {})
+        return self.openai_config
     
     def get_telegram_config(self):
         """
@@ -162,7 +230,7 @@ class ConfigManager:
         Returns:
             dict: Configuración de Telegram.
         """
-        return self.credentials.get('telegram', {})
+        return self.telegram_config
     
     def get_news_api_config(self):
         """
@@ -171,7 +239,7 @@ class ConfigManager:
         Returns:
             dict: Configuración de la API de noticias.
         """
-        return self.credentials.get('news_api', {})
+        return self.news_api_config
     
     def is_valid_credential(self, section, key):
         """
@@ -217,8 +285,21 @@ class ConfigManager:
         
         return len(missing) == 0, missing
 
+@lru_cache(maxsize=None)
+def get_config_manager(config_dir=None):
+    """
+    Obtiene una instancia compartida del gestor de configuración.
+    
+    Args:
+        config_dir (str, optional): Directorio de configuración.
+        
+    Returns:
+        ConfigManager: Gestor de configuración para ese directorio.
+    """
+    return ConfigManager(config_dir)
+
 # Instancia global para uso en todo el proyecto
-config_manager = ConfigManager()
+config_manager = get_config_manager()
 
 if __name__ == "__main__":
     # Ejemplo de uso
@@ -9,13 +9,48 @@ Prepara los datos para el análisis de sentimiento y correlación.
 import os
 import yaml
 import pandas as pd
-import re
-from nltk.tokenize import word_tokenize
+import numpy as np
+import bottleneck as bn
 from nltk.corpus import stopwords
 from nltk.stem import WordNetLemmatizer
 import nltk
 import logging
 import duckdb
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import csv as pa_csv
+
+# Columnas de precios usadas en el preprocesamiento
+STOCK_COLUMNS = ['Date', 'open', 'high', 'low', 'close', 'volume']
+
+# Preprocesador usado por cada proceso trabajador
+_worker_preprocessor = None
+
+def _init_company_worker(preprocessor):
+    """
+    Inicializa un proceso trabajador de empresas con su copia del preprocesador.
+    
+    Args:
+        preprocessor (DataPreprocessor): Preprocesador a usar en el proceso.
+    """
+    global _worker_preprocessor
+    _worker_preprocessor = preprocessor
+
+def _preprocess_company_worker(symbol, news_data, persist):
+    """
+    Preprocesa los datos de una empresa dentro de un proceso trabajador.
+    
+    Args:
+        symbol (str): Símbolo de la empresa.
+        news_data (pandas.DataFrame): Noticias preprocesadas de la empresa.
+        persist (bool): Si es True, guarda también los datos intermedios.
+        
+    Returns:
+        pandas.DataFrame: DataFrame combinado o None.
+    """
+    return _worker_preprocessor._preprocess_company(symbol, news_data, persist)
 
 class DataPreprocessor:
     """Clase para preprocesar datos de noticias y precios de acciones."""
@@ -40,18 +75,19 @@ class DataPreprocessor:
         
         # Asegurar que los recursos de NLTK estén descargados
         try:
-            nltk.data.find('tokenizers/punkt')
             nltk.data.find('corpora/stopwords')
             nltk.data.find('sentiment/vader_lexicon')
         except LookupError:
             print("Descargando recursos de NLTK...")
-            nltk.download('punkt')
             nltk.download('stopwords')
             nltk.download('wordnet')
             nltk.download('vader_lexicon')
         
         self.stop_words = set(stopwords.words('english'))
         self.lemmatizer = WordNetLemmatizer()
+        
+        # Caché de lemas por palabra (el vocabulario de las noticias se repite mucho)
+        self._lemma_cache = {}
     
     def _load_config(self, config_path):
         """
@@ -66,29 +102,74 @@ class DataPreprocessor:
         with open(config_path, 'r', encoding='utf-8') as file:
             return yaml.safe_load(file)
     
-    def preprocess_all_data(self):
+    def preprocess_all_data(self, persist=False):
         """
         Preprocesa todos los datos de noticias y precios para todas las empresas.
         
+        Args:
+            persist (bool): Si es True, guarda también los datos intermedios de
+                precios y noticias en Parquet.
+        
         Returns:
             dict: Datos preprocesados por símbolo de empresa.
         """
         results = {}
+        symbols = [company['symbol'] for company in self.config['companies']]
+        
+        # Consultar y preprocesar las noticias de todas las empresas de una vez
+        news_by_symbol = self._preprocess_news_data(symbols, persist)
         
-        for company in self.config['companies']:
-            symbol = company['symbol']
+        # Empresas aún sin procesar; las que no termine el pool se procesan en serie
+        pending = list(symbols)
+        
+        # Con una sola empresa no compensa arrancar procesos trabajadores
+        if len(symbols) > 1:
+            # Preprocesar los precios y combinar cada empresa en paralelo
+            max_workers = min(len(symbols), os.cpu_count() or 1)
             
-            print(f"Preprocesando datos para {symbol}...")
+            # Vaciar los registros en memoria antes de crear los procesos: con fork, cada
+            # hijo heredaría el búfer y volvería a escribirlo en el log
+            for handler in logging.getLogger().handlers:
+                handler.flush()
             
             try:
-                # Preprocesar datos de precios
-                stock_data = self._preprocess_stock_data(symbol)
-                
-                # Preprocesar noticias
-                news_data = self._preprocess_news_data(symbol)
-                
-                # Combinar datos de precios y noticias
-                combined_data = self._combine_data(stock_data, news_data, symbol)
+                with ProcessPoolExecutor(
+                    max_workers=max_workers,
+                    initializer=_init_company_worker,
+                    initargs=(self,)
+                ) as executor:
+                    futures = {
+                        executor.submit(_preprocess_company_worker, symbol, news_by_symbol[symbol], persist): symbol
+                        for symbol in symbols
+                    }
+                    
+                    for future in as_completed(futures):
+                        symbol = futures[future]
+                        
+                        try:
+                            combined_data = future.result()
+                        except BrokenProcessPool:
+                            raise
+                        except Exception as e:
+                            print(f"Error al preprocesar datos para {symbol}: {str(e)}")
+                            combined_data = None
+                        
+                        pending.remove(symbol)
+                        if combined_data is not None:
+                            results[symbol] = combined_data
+            
+            except BrokenProcessPool as e:
+                # Un fallo de los procesos no es un error de la empresa: se repiten en serie
+                # las empresas que quedaban
+                logging.getLogger(__name__).error(
+                    f"Los procesos trabajadores han fallado ({str(e)}). Preprocesando en serie {len(pending)} empresas."
+                )
+            else:
+                return results
+        
+        for symbol in pending:
+            try:
+                combined_data = self._preprocess_company(symbol, news_by_symbol[symbol], persist)
                 
                 if combined_data is not None:
                     results[symbol] = combined_data
@@ -98,12 +179,33 @@ class DataPreprocessor:
         
         return results
     
-    def _preprocess_stock_data(self, symbol):
+    def _preprocess_company(self, symbol, news_data, persist=False):
+        """
+        Preprocesa los precios de una empresa y los combina con sus noticias.
+        
+        Args:
+            symbol (str): Símbolo de la empresa.
+            news_data (pandas.DataFrame): Noticias preprocesadas de la empresa.
+            persist (bool): Si es True, guarda también los datos intermedios.
+            
+        Returns:
+            pandas.DataFrame: DataFrame combinado o None.
+        """
+        print(f"Preprocesando datos para {symbol}...")
+        
+        # Preprocesar datos de precios
+        stock_data = self._preprocess_stock_data(symbol, persist)
+        
+        # Combinar datos de precios y noticias
+        return self._combine_data(stock_data, news_data, symbol)
+    
+    def _preprocess_stock_data(self, symbol, persist=False):
         """
         Preprocesa los datos de precios de acciones.
         
         Args:
             symbol (str): Símbolo de la empresa.
+            persist (bool): Si es True, guarda los datos preprocesados en Parquet.
             
         Returns:
             pandas.DataFrame: DataFrame con los datos de precios preprocesados.
@@ -114,131 +216,206 @@ class DataPreprocessor:
             print(f"No se encontraron datos históricos para {symbol}")
             return None
         
-        # Cargar datos
-        df = pd.read_csv(file_path, index_col='Date', parse_dates=True)
+        # Cargar datos, reutilizando la copia en Parquet si está al día con el CSV
+        parquet_path = os.path.splitext(file_path)[0] + '.parquet'
+        
+        if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(file_path):
+            df = pd.read_parquet(parquet_path)
+        else:
+            # Leer la fecha como texto para que Arrow no la convierta a UTC
+            convert_options = pa_csv.ConvertOptions(
+                include_columns=STOCK_COLUMNS,
+                column_types={'Date': pa.string()}
+            )
+            df = pa_csv.read_csv(file_path, convert_options=convert_options).to_pandas(
+                types_mapper=pd.ArrowDtype
+            )
+            
+            # Conservar solo el día local del mercado, descartando hora y desfase horario
+            df.index = pd.to_datetime(df.pop('Date').str.slice(0, 10))
+            df.index.name = 'Date'
+            
+            df.to_parquet(parquet_path, engine='pyarrow', compression='zstd')
+        
+        # Calcular indicadores técnicos básicos sobre un array contiguo de NumPy
+        close = df['close'].to_numpy(dtype=np.float64, na_value=np.nan)
         
-        # Calcular indicadores técnicos básicos
         # Rendimiento diario
-        df['daily_return'] = df['close'].pct_change()
+        daily_return = np.empty_like(close)
+        daily_return[:1] = np.nan
+        daily_return[1:] = close[1:] / close[:-1] - 1
+        df['daily_return'] = daily_return
         
         # Media móvil de 5 y 20 días
-        df['ma5'] = df['close'].rolling(window=5).mean()
-        df['ma20'] = df['close'].rolling(window=20).mean()
+        df['ma5'] = bn.move_mean(close, window=5)
+        df['ma20'] = bn.move_mean(close, window=20)
         
         # Volatilidad (desviación estándar de rendimientos en 10 días)
-        df['volatility'] = df['daily_return'].rolling(window=10).std()
+        df['volatility'] = bn.move_std(daily_return, window=10, ddof=1)
         
         # Eliminar filas con valores NaN
         df.dropna(inplace=True)
         
-        # Guardar datos preprocesados
-        processed_file_path = os.path.join(self.processed_dir, f"{symbol}_stock_processed.csv")
-        df.to_csv(processed_file_path)
+        # Guardar datos preprocesados solo si se solicita
+        if persist:
+            processed_file_path = os.path.join(self.processed_dir, f"{symbol}_stock_processed.parquet")
+            df.to_parquet(processed_file_path, engine='pyarrow', compression='zstd')
         
         return df
     
-    def _preprocess_news_data(self, symbol):
+    def _preprocess_news_data(self, symbols, persist=False):
         logger = logging.getLogger(__name__)
         """
-        Preprocesa los datos de noticias para un símbolo específico.
+        Preprocesa los datos de noticias de varias empresas con una sola consulta.
         
         Args:
-            symbol (str): Símbolo de la empresa.
+            symbols (list): Símbolos de las empresas.
+            persist (bool): Si es True, guarda las noticias preprocesadas en Parquet.
             
         Returns:
-            pandas.DataFrame: DataFrame con los datos de noticias preprocesados.
+            dict: DataFrame con las noticias preprocesadas por símbolo de empresa
+                (vacío si no hay noticias).
         """
+        news_by_symbol = {symbol: pd.DataFrame() for symbol in symbols}
+        db_path = os.path.join(self.data_dir, 'news_database.duckdb')
+        
+        if not symbols:
+            return news_by_symbol
+        
+        if not os.path.exists(db_path):
+            logger.warning("No existe la base de datos de noticias para preprocesar")
+            return news_by_symbol
+        
         try:
-            # Conectar a la base de datos DuckDB
-            db_path = os.path.join(self.data_dir, 'news_database.duckdb')
-            conn = duckdb.connect(db_path)
-            
-            # Consultar noticias para el símbolo específico
-            query = f"""
+            # Consultar noticias de todas las empresas, limpiando el texto
+            # (minúsculas, URLs, caracteres especiales y números) en DuckDB
+            query = r"""
                 SELECT 
+                    symbol,
                     title, 
                     description, 
                     content, 
                     published_at, 
                     url, 
                     source_name,
-                    relevance
+                    relevance,
+                    array_to_string(
+                        regexp_extract_all(
+                            regexp_replace(
+                                regexp_replace(
+                                    lower(concat_ws(' ', title, description, content)),
+                                    'http\S+', '', 'g'
+                                ),
+                                '[^\p{L}\p{N}_\s]|\p{Nd}+', '', 'g'
+                            ),
+                            '[\p{L}\p{N}_]+'
+                        ),
+                        ' '
+                    ) AS text
                 FROM news 
-                WHERE symbol = '{symbol}' 
-                ORDER BY published_at DESC
+                WHERE symbol = ANY(?) 
+                ORDER BY symbol, published_at
             """
             
-            # Ejecutar consulta y obtener DataFrame
-            news_df = conn.execute(query).fetchdf()
-            
-            # Cerrar conexión
-            conn.close()
+            # Ejecutar consulta y obtener una tabla Arrow. La conexión usa la configuración
+            # por defecto para poder convivir en el proceso con la de NewsDatabase
+            conn = duckdb.connect(db_path)
             
-            if news_df.empty:
-                logger.warning(f"No se encontraron noticias para {symbol} en la base de datos")
-                return pd.DataFrame()
+            try:
+                news_table = conn.execute(query, [symbols]).fetch_arrow_table()
+            finally:
+                conn.close()
             
-            # Preprocesar texto de noticias
-            news_df['text'] = news_df.apply(
-                lambda row: f"{row['title']} {row['description']} {row['content']}", 
-                axis=1
+            # Eliminar stopwords y lematizar el texto ya limpio sin pasar por objetos de Python
+            news_table = news_table.set_column(
+                news_table.schema.get_field_index('text'),
+                'text',
+                self._lemmatize_texts(news_table['text'])
             )
             
-            # Limpiar texto
-            news_df['text'] = news_df['text'].apply(self._clean_text)
+            # Convertir a DataFrame con columnas respaldadas por Arrow
+            news_df = news_table.to_pandas(types_mapper=pd.ArrowDtype)
             
             # Convertir fecha de publicación a datetime si no lo es ya
             if not pd.api.types.is_datetime64_any_dtype(news_df['published_at']):
                 news_df['published_at'] = pd.to_datetime(news_df['published_at'])
             
-            # Ordenar por fecha
-            news_df = news_df.sort_values('published_at')
-            
-            # Guardar DataFrame preprocesado
-            output_path = os.path.join(self.data_dir, 'preprocessed', f"{symbol}_news_preprocessed.csv")
-            news_df.to_csv(output_path, index=False)
-            
-            logger.info(f"Datos de noticias preprocesados para {symbol}: {len(news_df)} noticias")
-            
-            return news_df
+            # Separar por empresa, manteniendo el orden por fecha de la consulta
+            for symbol, symbol_df in news_df.groupby('symbol', sort=False):
+                symbol_df = symbol_df.drop(columns='symbol').reset_index(drop=True)
+                news_by_symbol[symbol] = symbol_df
+                
+                # Guardar DataFrame preprocesado solo si se solicita
+                if persist:
+                    output_path = os.path.join(self.processed_dir, f"{symbol}_news_preprocessed.parquet")
+                    symbol_df.to_parquet(output_path, engine='pyarrow', compression='zstd', index=False)
+                
+                logger.info(f"Datos de noticias preprocesados para {symbol}: {len(symbol_df)} noticias")
             
         except Exception as e:
-            logger.error(f"Error al preprocesar datos de noticias para {symbol}: {str(e)}")
-            return pd.DataFrame()
+            logger.error(f"Error al preprocesar datos de noticias: {str(e)}")
+        
+        for symbol, symbol_df in news_by_symbol.items():
+            if symbol_df.empty:
+                logger.warning(f"No se encontraron noticias para {symbol} en la base de datos")
+        
+        return news_by_symbol
     
-    def _clean_text(self, text):
+    def _lemmatize_texts(self, texts):
         """
-        Limpia y preprocesa texto.
+        Elimina stopwords y lematiza una columna Arrow de textos ya limpios,
+        consultando el lematizador una sola vez por palabra distinta.
         
         Args:
-            text (str): Texto a limpiar.
+            texts (pyarrow.ChunkedArray): Textos limpios y tokenizados por espacios.
             
         Returns:
-            str: Texto limpio.
+            pyarrow.Array: Textos lematizados en el mismo orden.
         """
-        if not isinstance(text, str) or pd.isna(text):
-            return ""
-        
-        # Convertir a minúsculas
-        text = text.lower()
-        
-        # Eliminar URLs
-        text = re.sub(r'http\S+', '', text)
-        
-        # Eliminar caracteres especiales y números
-        text = re.sub(r'[^\w\s]', '', text)
-        text = re.sub(r'\d+', '', text)
-        
-        # Tokenizar
-        tokens = word_tokenize(text)
-        
-        # Eliminar stopwords y lematizar
-        tokens = [self.lemmatizer.lemmatize(word) for word in tokens if word not in self.stop_words]
+        texts = pc.fill_null(texts.combine_chunks().cast(pa.string()), '')
+        tokens = pc.utf8_split_whitespace(texts)
+        words = pc.list_flatten(tokens)
+        parents = pc.list_parent_indices(tokens)
+        
+        # Lematizar el vocabulario distinto; las stopwords quedan como nulos
+        vocabulary = pc.unique(words)
+        lemmas = pa.array(self._lemmatize_vocabulary(vocabulary.to_pylist()), type=pa.string())
+        word_lemmas = pc.take(lemmas, pc.index_in(words, value_set=vocabulary))
+        
+        # Descartar las stopwords y reconstruir la lista de palabras de cada texto
+        keep = pc.is_valid(word_lemmas)
+        counts = np.bincount(pc.filter(parents, keep).to_numpy(), minlength=len(texts))
+        offsets = pa.array(np.concatenate(([0], np.cumsum(counts))), type=pa.int32())
+        
+        return pc.binary_join(pa.ListArray.from_arrays(offsets, pc.filter(word_lemmas, keep)), ' ')
+    
+    def _lemmatize_vocabulary(self, words):
+        """
+        Lematiza una lista de palabras distintas.
         
-        # Unir tokens
-        cleaned_text = ' '.join(tokens)
+        Args:
+            words (list): Palabras en minúsculas.
+            
+        Returns:
+            list: Lema de cada palabra, o None si es una stopword.
+        """
+        lemmatize = self.lemmatizer.lemmatize
+        stop_words = self.stop_words
+        lemma_cache = self._lemma_cache
+        lemmas = []
+        
+        for word in words:
+            if word in stop_words:
+                lemmas.append(None)
+                continue
+            
+            lemma = lemma_cache.get(word)
+            if lemma is None:
+                lemma = lemma_cache[word] = lemmatize(word)
+            
+            lemmas.append(lemma)
         
-        return cleaned_text
+        return lemmas
     
     def _combine_data(self, stock_data, news_data, symbol):
         """
@@ -255,36 +432,27 @@ class DataPreprocessor:
         if stock_data is None or news_data is None:
             return None
         
-        # Agrupar noticias por día
-        news_data['date'] = news_data.index.date
-        daily_news = news_data.groupby('date').agg({
-            'content': lambda x: ' '.join(x),
-            'url': 'count'
-        }).rename(columns={'url': 'news_count'})
-        daily_news.index = pd.to_datetime(daily_news.index)
-        
-        # Convertir índice de stock_data a date para la unión
-        stock_data_copy = stock_data.copy()
-        stock_data_copy.index = pd.to_datetime(stock_data_copy.index)
-        stock_data_copy['date'] = stock_data_copy.index.date
-        stock_data_copy.index = pd.to_datetime(stock_data_copy.index)
-        
-        # Unir datos de precios con noticias
-        combined = pd.merge(
-            stock_data_copy,
-            daily_news,
-            left_index=True,
-            right_index=True,
-            how='left'
-        )
+        # Agrupar noticias por día de publicación
+        if news_data.empty:
+            daily_news = pd.DataFrame(columns=['content', 'news_count'])
+        else:
+            news_days = pd.DatetimeIndex(news_data['published_at']).normalize()
+            has_content = news_data['content'].notna().to_numpy()
+            daily_news = pd.DataFrame({
+                'content': news_data['content'][has_content].groupby(news_days[has_content]).agg(' '.join),
+                'news_count': news_data['url'].groupby(news_days).count()
+            })
+        
+        # Unir datos de precios (ya indexados por día) con noticias, sin copiar los precios
+        combined = stock_data.join(daily_news, how='left')
         
         # Rellenar valores faltantes
         combined['news_count'] = combined['news_count'].fillna(0)
         combined['content'] = combined['content'].fillna('')
         
         # Guardar datos combinados
-        combined_file_path = os.path.join(self.processed_dir, f"{symbol}_combined.csv")
-        combined.to_csv(combined_file_path)
+        combined_file_path = os.path.join(self.processed_dir, f"{symbol}_combined.parquet")
+        combined.to_parquet(combined_file_path, engine='pyarrow', compression='zstd')
         
         return combined
 
@@ -9,51 +9,66 @@ Coordina la ejecución de todos los componentes del sistema.
 import os
 import sys
 import argparse
-from datetime import datetime
+from datetime import datetime, timedelta
 import schedule
 import time
 import logging
+from logging.handlers import MemoryHandler
+from functools import cached_property
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
-# Importar módulos del proyecto
+# Importar módulos del proyecto (los componentes pesados se importan al usarse)
 from config_manager import config_manager
-from stock_data_collector import StockDataCollector
-from news_collector import NewsCollector
-from data_preprocessor import DataPreprocessor
-from sentiment_analyzer import SentimentAnalyzer
-from chatgpt_sentiment_analyzer import ChatGPTSentimentAnalyzer
-from sentiment_price_correlator import SentimentPriceCorrelator
-from results_visualizer import ResultsVisualizer
-from openai_cost_tracker import cost_tracker
-from superset_integration import SupersetIntegration
 
 # Configurar logging
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# El fichero de log se escribe en bloques: cada 1024 registros o ante un WARNING
+_file_handler = logging.FileHandler("main.log")
+_file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    format=LOG_FORMAT,
     handlers=[
-        logging.FileHandler("main.log"),
+        MemoryHandler(1024, flushLevel=logging.WARNING, target=_file_handler),
         logging.StreamHandler()
     ]
 )
 logger = logging.getLogger(__name__)
 
-try:
-    import nltk
-    # Verificar si el recurso ya está descargado
-    try:
-        nltk.data.find('tokenizers/punkt')
-    except LookupError:
-        # Si no está descargado, descargarlo
-        nltk.download('punkt', quiet=True)
+# Directorios del proyecto, calculados y creados una sola vez
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(PROJECT_DIR, 'data')
+RESULTS_DIR = os.path.join(DATA_DIR, 'results')
+os.makedirs(RESULTS_DIR, exist_ok=True)
+
+# Componente de análisis propio de cada proceso trabajador
+_worker_component = None
+
+def _init_component_worker(component_class):
+    """
+    Inicializa un proceso trabajador creando su propia instancia del componente.
+    
+    Args:
+        component_class (type): Clase del componente (analizador, correlador o visualizador).
+    """
+    global _worker_component
+    _worker_component = component_class()
+
+def _run_component_worker(method_name, company):
+    """
+    Procesa una empresa con el componente del proceso trabajador.
     
-    # Verificar otros recursos que puedas necesitar
-    # Por ejemplo, para análisis de sentimiento:
-    try:
-        nltk.data.find('sentiment/vader_lexicon')
-    except LookupError:
-        nltk.download('vader_lexicon', quiet=True)
-except Exception as e:
-    print(f"Error al inicializar NLTK: {str(e)}")
+    Args:
+        method_name (str): Método del componente a ejecutar.
+        company (dict): Empresa con 'symbol' y 'name'.
+        
+    Returns:
+        object: Resultado del método para la empresa.
+    """
+    return getattr(_worker_component, method_name)(company)
 
 class SentimentAnalysisSystem:
     """Clase principal que coordina el sistema de análisis de sentimiento."""
@@ -64,13 +79,11 @@ class SentimentAnalysisSystem:
         """
         # Obtener configuración
         self.config = config_manager.get_config()
-        self.project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.project_dir = PROJECT_DIR
         
-        # Crear directorios necesarios
-        self.data_dir = os.path.join(self.project_dir, 'data')
-        self.results_dir = os.path.join(self.data_dir, 'results')
-        os.makedirs(self.data_dir, exist_ok=True)
-        os.makedirs(self.results_dir, exist_ok=True)
+        # Directorios de datos
+        self.data_dir = DATA_DIR
+        self.results_dir = RESULTS_DIR
         
         # Determinar si se usa ChatGPT para el análisis de sentimiento
         self.use_chatgpt = config_manager.get_config('sentiment_analysis', 'use_chatgpt', False)
@@ -81,6 +94,52 @@ class SentimentAnalysisSystem:
         # Validar credenciales requeridas
         self._validate_credentials()
     
+    # Los componentes se crean una sola vez y se reutilizan entre ejecuciones
+    @cached_property
+    def stock_collector(self):
+        from stock_data_collector import StockDataCollector
+        return StockDataCollector()
+    
+    @cached_property
+    def news_collector(self):
+        from news_collector import NewsCollector
+        return NewsCollector()
+    
+    @cached_property
+    def preprocessor(self):
+        from data_preprocessor import DataPreprocessor
+        return DataPreprocessor()
+    
+    @cached_property
+    def chatgpt_analyzer(self):
+        from chatgpt_sentiment_analyzer import ChatGPTSentimentAnalyzer
+        return ChatGPTSentimentAnalyzer()
+    
+    @cached_property
+    def sentiment_analyzer(self):
+        from sentiment_analyzer import SentimentAnalyzer
+        return SentimentAnalyzer()
+    
+    @cached_property
+    def correlator(self):
+        from sentiment_price_correlator import SentimentPriceCorrelator
+        return SentimentPriceCorrelator()
+    
+    @cached_property
+    def visualizer(self):
+        from results_visualizer import ResultsVisualizer
+        return ResultsVisualizer()
+    
+    @cached_property
+    def superset(self):
+        from superset_integration import SupersetIntegration
+        return SupersetIntegration()
+    
+    @cached_property
+    def cost_tracker(self):
+        from openai_cost_tracker import get_cost_tracker
+        return get_cost_tracker()
+    
     def _validate_credentials(self):
         """
         Valida que todas las credenciales requeridas estén configuradas.
@@ -94,76 +153,116 @@ class SentimentAnalysisSystem:
             
             logger.warning("Algunas funcionalidades pueden no estar disponibles.")
     
+    def _run_per_company(self, component, method_name):
+        """
+        Ejecuta un método por empresa repartiendo las empresas entre procesos.
+        
+        Args:
+            component (object): Componente ya creado, usado si no compensa paralelizar.
+            method_name (str): Método del componente que procesa una empresa.
+            
+        Returns:
+            dict: Resultados por símbolo de empresa (solo los que no son None).
+        """
+        companies = config_manager.get_companies()
+        workers = min(len(companies), os.cpu_count() or 1)
+        results = None
+        
+        if workers > 1:
+            # Vaciar los registros en memoria antes de crear los procesos: con fork, cada
+            # hijo heredaría el búfer y volvería a escribirlo en main.log
+            for handler in logging.getLogger().handlers:
+                handler.flush()
+            
+            try:
+                # Cada proceso crea su propio componente (y sus propias conexiones)
+                with ProcessPoolExecutor(max_workers=workers,
+                                         initializer=_init_component_worker,
+                                         initargs=(type(component),)) as executor:
+                    results = list(executor.map(
+                        _run_component_worker, [method_name] * len(companies), companies
+                    ))
+            except BrokenProcessPool as e:
+                logger.error(f"Los procesos trabajadores han fallado ({str(e)}). Procesando las empresas en serie.")
+        
+        if results is None:
+            results = [getattr(component, method_name)(company) for company in companies]
+        
+        return {
+            company['symbol']: result
+            for company, result in zip(companies, results)
+            if result is not None
+        }
+    
     def run_initial_analysis(self):
         """
         Ejecuta el análisis inicial completo.
         Recopila datos históricos, noticias, y realiza el análisis completo.
         """
         logger.info("=== Iniciando análisis inicial completo ===")
-        start_time = datetime.now()
+        start_time = time.perf_counter()
         
         # Paso 1: Recopilar datos históricos de acciones
         logger.info("--- Recopilando datos históricos de acciones ---")
-        stock_collector = StockDataCollector()
-        stock_collector.collect_historical_data()
+        self.stock_collector.collect_historical_data()
         
         # Paso 2: Recopilar noticias históricas
         logger.info("--- Recopilando noticias históricas ---")
-        news_collector = NewsCollector()
-        news_collector.collect_historical_news()
+        self.news_collector.collect_historical_news()
         
         # Paso 3: Preprocesar datos
         logger.info("--- Preprocesando datos ---")
-        preprocessor = DataPreprocessor()
-        preprocessor.preprocess_all_data()
+        self.preprocessor.preprocess_all_data()
         
         # Paso 4: Analizar sentimiento (con ChatGPT o método tradicional)
         if self.use_chatgpt:
             logger.info("--- Analizando sentimiento con ChatGPT ---")
-            analyzer = ChatGPTSentimentAnalyzer()
+            # Limitado por la red: el propio analizador reparte las empresas en hilos
+            self.chatgpt_analyzer.analyze_all_companies()
         else:
             logger.info("--- Analizando sentimiento con métodos tradicionales ---")
-            analyzer = SentimentAnalyzer()
-            
-        analyzer.analyze_all_companies()
+            self._run_per_company(self.sentiment_analyzer, 'analyze_company')
         
         # Paso 5: Analizar correlación
         logger.info("--- Analizando correlación entre sentimiento y precios ---")
-        correlator = SentimentPriceCorrelator()
-        correlator.analyze_all_companies()
+        self._run_per_company(self.correlator, 'analyze_company')
         
         # Paso 6: Generar visualizaciones
         logger.info("--- Generando visualizaciones ---")
-        visualizer = ResultsVisualizer()
-        visualizer.visualize_all_companies()
+        self._run_per_company(self.visualizer, 'visualize_company')
+        
+        # La visualización comparativa necesita las de todas las empresas
+        try:
+            self.visualizer.generate_comparative_visualization()
+        except Exception as e:
+            logger.error(f"Error al generar visualización comparativa: {str(e)}")
         
         # Paso 7: Generar informe de costes si se usa ChatGPT
         if self.use_chatgpt and config_manager.get_config('cost_tracking', 'enabled', True):
             logger.info("--- Generando informe de costes de OpenAI ---")
-            cost_report = cost_tracker.generate_cost_report()
+            cost_report = self.cost_tracker.generate_cost_report()
             logger.info(f"Informe de costes generado en: {cost_report}")
             
             # Mostrar coste total
-            total_cost = cost_tracker.get_total_cost()
+            total_cost = self.cost_tracker.get_total_cost()
             logger.info(f"Coste total acumulado: ${total_cost:.4f} USD")
         
         # Paso 8: Exportar datos para Superset si está habilitado
         if self.use_superset:
             logger.info("--- Exportando datos para Superset ---")
-            superset = SupersetIntegration()
-            export_results = superset.export_data_for_superset()
+            export_results = self.superset.export_data_for_superset()
             logger.info(f"Datos exportados para Superset: {export_results}")
             
             # Generar instrucciones y configuración
-            instructions_path = superset.generate_superset_instructions()
-            docker_compose_path = superset.generate_docker_compose()
+            instructions_path = self.superset.generate_superset_instructions()
+            docker_compose_path = self.superset.generate_docker_compose()
             
             logger.info(f"Instrucciones para Superset generadas en: {instructions_path}")
             logger.info(f"Archivo docker-compose.yml generado en: {docker_compose_path}")
         
         # Calcular tiempo total
-        end_time = datetime.now()
-        duration = end_time - start_time
+        # Reloj monotónico: no le afectan los ajustes de la hora del sistema
+        duration = timedelta(seconds=time.perf_counter() - start_time)
         logger.info(f"=== Análisis inicial completado en {duration} ===")
     
     def run_daily_update(self):
@@ -172,19 +271,17 @@ class SentimentAnalysisSystem:
         Recopila nuevas noticias y actualiza el análisis.
         """
         logger.info("=== Iniciando actualización diaria ===")
-        start_time = datetime.now()
+        start_time = time.perf_counter()
         
         # Verificar límite de gasto diario si está configurado
         if self.use_chatgpt and config_manager.get_config('cost_tracking', 'enabled', True):
             daily_limit = config_manager.get_config('cost_tracking', 'daily_limit', 0)
             if daily_limit > 0:
-                # Obtener costes del día actual
+                # Obtener el coste del día actual (la suma se calcula en la base de datos)
                 today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-                daily_costs = cost_tracker.get_costs_summary(start_date=today)
+                daily_total = self.cost_tracker.get_total_cost(start_date=today)
                 
-                if not daily_costs.empty:
-                    daily_total = daily_costs['total_cost'].sum()
-                    
+                if daily_total > 0:
                     # Verificar si se ha alcanzado el límite
                     if daily_total >= daily_limit:
                         logger.warning(f"Se ha alcanzado el límite diario de gasto (${daily_limit:.2f}). Usando análisis tradicional.")
@@ -199,51 +296,51 @@ class SentimentAnalysisSystem:
         
         # Paso 1: Actualizar datos de acciones (últimos 2 días)
         logger.info("--- Actualizando datos de acciones ---")
-        stock_collector = StockDataCollector()
-        stock_collector.collect_historical_data()
+        self.stock_collector.collect_historical_data()
         
         # Paso 2: Actualizar noticias (últimos 2 días)
         logger.info("--- Actualizando noticias ---")
-        news_collector = NewsCollector()
-        news_collector.update_news()
+        self.news_collector.update_news()
         
         # Paso 3: Preprocesar datos
         logger.info("--- Preprocesando datos ---")
-        preprocessor = DataPreprocessor()
-        preprocessor.preprocess_all_data()
+        self.preprocessor.preprocess_all_data()
         
         # Paso 4: Actualizar análisis de sentimiento (con ChatGPT o método tradicional)
         if self.use_chatgpt:
             logger.info("--- Actualizando análisis de sentimiento con ChatGPT ---")
-            analyzer = ChatGPTSentimentAnalyzer()
+            # Limitado por la red: el propio analizador reparte las empresas en hilos
+            self.chatgpt_analyzer.analyze_all_companies()
         else:
             logger.info("--- Actualizando análisis de sentimiento con métodos tradicionales ---")
-            analyzer = SentimentAnalyzer()
-            
-        analyzer.analyze_all_companies()
+            self._run_per_company(self.sentiment_analyzer, 'analyze_company')
         
         # Paso 5: Actualizar análisis de correlación
         logger.info("--- Actualizando análisis de correlación ---")
-        correlator = SentimentPriceCorrelator()
-        correlator.analyze_all_companies()
+        self._run_per_company(self.correlator, 'analyze_company')
         
         # Paso 6: Actualizar visualizaciones
         logger.info("--- Actualizando visualizaciones ---")
-        visualizer = ResultsVisualizer()
-        visualizer.visualize_all_companies()
+        self._run_per_company(self.visualizer, 'visualize_company')
+        
+        # La visualización comparativa necesita las de todas las empresas
+        try:
+            self.visualizer.generate_comparative_visualization()
+        except Exception as e:
+            logger.error(f"Error al generar visualización comparativa: {str(e)}")
         
         # Paso 7: Generar informe de costes si se usa ChatGPT y está configurado
         if self.use_chatgpt and config_manager.get_config('cost_tracking', 'daily_report', True):
             logger.info("--- Generando informe diario de costes de OpenAI ---")
-            cost_report = cost_tracker.generate_cost_report()
+            cost_report = self.cost_tracker.generate_cost_report()
             logger.info(f"Informe de costes generado en: {cost_report}")
             
             # Mostrar coste total
-            total_cost = cost_tracker.get_total_cost()
-            daily_costs = cost_tracker.get_daily_costs(1)
+            total_cost = self.cost_tracker.get_total_cost()
+            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            daily_total = self.cost_tracker.get_total_cost(start_date=today)
             
-            if not daily_costs.empty:
-                daily_total = daily_costs['total_cost'].sum()
+            if daily_total > 0:
                 logger.info(f"Coste de hoy: ${daily_total:.4f} USD")
             
             logger.info(f"Coste total acumulado: ${total_cost:.4f} USD")
@@ -251,13 +348,12 @@ class SentimentAnalysisSystem:
         # Paso 8: Actualizar datos para Superset si está habilitado y configurado
         if self.use_superset and config_manager.get_config('superset', 'auto_update', True):
             logger.info("--- Actualizando datos para Superset ---")
-            superset = SupersetIntegration()
-            export_results = superset.export_data_for_superset()
+            export_results = self.superset.export_data_for_superset()
             logger.info(f"Datos actualizados para Superset: {export_results}")
         
         # Calcular tiempo total
-        end_time = datetime.now()
-        duration = end_time - start_time
+        # Reloj monotónico: no le afectan los ajustes de la hora del sistema
+        duration = timedelta(seconds=time.perf_counter() - start_time)
         logger.info(f"=== Actualización completada en {duration} ===")
     
     def schedule_updates(self):
@@ -284,7 +380,8 @@ class SentimentAnalysisSystem:
         try:
             while True:
                 schedule.run_pending()
-                time.sleep(60)  # Comprobar cada minuto
+                # Dormir hasta la siguiente ejecución programada en lugar de comprobar cada minuto
+                time.sleep(max(schedule.idle_seconds() or 0, 1))
         except KeyboardInterrupt:
             logger.info("Servicio de actualización detenido.")
 
@@ -321,11 +418,11 @@ def main():
         # Generar informe de costes
         if config_manager.get_config('cost_tracking', 'enabled', True):
             logger.info("Generando informe de costes de OpenAI")
-            cost_report = cost_tracker.generate_cost_report()
+            cost_report = system.cost_tracker.generate_cost_report()
             
-            total_cost = cost_tracker.get_total_cost()
-            costs_by_symbol = cost_tracker.get_costs_by_symbol()
-            daily_costs = cost_tracker.get_daily_costs(30)
+            total_cost = system.cost_tracker.get_total_cost()
+            costs_by_symbol = system.cost_tracker.get_costs_by_symbol()
+            daily_costs = system.cost_tracker.get_daily_costs(30)
             
             logger.info(f"Informe de costes generado en: {cost_report}")
             logger.info(f"Coste total acumulado: ${total_cost:.4f} USD")
@@ -349,6 +446,7 @@ def main():
         # Exportar datos para Superset
         if config_manager.get_config('superset', 'enabled', True):
             logger.info("Exportando datos para Superset")
+            from superset_integration import SupersetIntegration
             superset = SupersetIntegration()
             export_results = superset.export_data_for_superset()
             
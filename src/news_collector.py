@@ -9,27 +9,66 @@ Integrado con DuckDB para almacenamiento eficiente.
 import os
 import sys
 import json
-import requests
-from datetime import datetime, timedelta
-import time
+import hashlib
+import diskcache
+import httpx
+import asyncio
+import math
+from datetime import date, datetime, timedelta, timezone
 import logging
-from newsapi import NewsApiClient
+from logging.handlers import MemoryHandler
+from aiolimiter import AsyncLimiter
 
 # Importar módulos del proyecto
 from config_manager import config_manager
 from news_database import NewsDatabase
 
 # Configurar logging
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# El fichero de log se escribe en bloques: cada 1024 registros o ante un WARNING
+_file_handler = logging.FileHandler("news_collector.log")
+_file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    format=LOG_FORMAT,
     handlers=[
-        logging.FileHandler("news_collector.log"),
+        MemoryHandler(1024, flushLevel=logging.WARNING, target=_file_handler),
         logging.StreamHandler()
     ]
 )
 logger = logging.getLogger(__name__)
 
+# Límites de las consultas agrupadas a la API de noticias
+MAX_QUERY_LENGTH = 500
+MAX_COMPANIES_PER_QUERY = 10
+
+def _search_name(name):
+    """
+    Normaliza el nombre de una empresa para buscarlo: sin la puntuación final
+    (p. ej. "International Airlines Group."), que haría la frase exacta más estricta.
+    
+    Args:
+        name (str): Nombre de la empresa en la configuración.
+        
+    Returns:
+        str: Nombre sin espacios ni puntuación al final.
+    """
+    return name.strip().rstrip('.,;:!?').strip()
+
+# Artículos por página de la API (máximo permitido por NewsAPI)
+PAGE_SIZE = 100
+
+# Tiempo de vida de las respuestas de la API guardadas en caché (segundos)
+API_CACHE_EXPIRE = 24 * 60 * 60
+
+# Directorios del proyecto, calculados y creados una sola vez
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(PROJECT_DIR, 'data')
+NEWS_DIR = os.path.join(DATA_DIR, 'news')
+os.makedirs(NEWS_DIR, exist_ok=True)
+
 class NewsCollector:
     """Clase para recopilar noticias relacionadas con empresas."""
     
@@ -43,6 +82,9 @@ class NewsCollector:
         period_config = config_manager.get_config('general','historical_period')
         self.historical_period_value = period_config.get('value', 1)
         self.historical_period_unit = period_config.get('unit', 'years')
+        self._historical_delta = self._build_historical_delta(
+            self.historical_period_value, self.historical_period_unit
+        )
         
         # Verificar API key
         self.api_key = self.news_api_config.get('api_key')
@@ -50,19 +92,25 @@ class NewsCollector:
             logger.warning("API key de noticias no configurada. La recopilación de noticias no funcionará.")
             self.api_key = None
         
-        # Inicializar cliente de API de noticias
-        if self.api_key:
-            self.newsapi = NewsApiClient(api_key=self.api_key)
-        else:
-            self.newsapi = None
+        # Configuración de las peticiones a la API de noticias
+        self.everything_url = f"{self.news_api_config.get('base_url', 'https://newsapi.org/v2').rstrip('/')}/everything"
+        self.concurrency = int(self.news_api_config.get('concurrency', 4))
+        self.requests_per_minute = int(self.news_api_config.get('requests_per_minute', 60))
+        self.max_pages = max(1, int(self.news_api_config.get('max_pages', 5)))
+        self.language = self.news_api_config.get('language', 'en')
+        
+        # Las empresas con noticias más recientes que esta ventana no se consultan al actualizar
+        self.freshness_window = timedelta(hours=int(self.news_api_config.get('freshness_hours', 6)))
         
         # Inicializar base de datos
         self.db = NewsDatabase()
         
-        # Crear directorios necesarios
-        self.data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
-        self.news_dir = os.path.join(self.data_dir, 'news')
-        os.makedirs(self.news_dir, exist_ok=True)
+        # Directorios de datos
+        self.data_dir = DATA_DIR
+        self.news_dir = NEWS_DIR
+        
+        # Caché en disco de las respuestas de la API de noticias
+        self.api_cache = diskcache.Cache(os.path.join(self.news_dir, '.api_cache'))
     
     def collect_historical_news(self):
         """
@@ -75,50 +123,37 @@ class NewsCollector:
             logger.error("No se puede recopilar noticias sin una API key válida.")
             return {}
         
-        results = {}
+        # Calcular fecha de inicio según el periodo histórico configurado
+        end_date = datetime.now()
+        start_date = end_date - self._historical_delta
         
-        for company in self.companies:
-            symbol = company['symbol']
-            name = company['name']
-            
-            logger.info(f"Recopilando noticias históricas para {name} ({symbol})...")
-            
-            try:
-                # Calcular fecha de inicio (hace X años)
-                end_date = datetime.now()
-                if self.historical_period_unit == 'years':
-                    start_date = end_date - timedelta(days=365 * self.historical_period_value)
-                elif self.historical_period_unit == 'months':
-                    start_date = end_date - timedelta(days=28 * self.historical_period_value)
-                elif self.historical_period_unit == 'weeks':
-                    start_date = end_date - timedelta(weeks=self.historical_period_value)
-                elif self.historical_period_unit == 'days':
-                    start_date = end_date - timedelta(days=self.historical_period_value)
-                else:
-                    # Unidad no reconocida, usar años por defecto
-                    start_date = end_date - timedelta(days=365)
-                
-                # Recopilar noticias
-                news_list = self._collect_news_for_period(symbol, name, start_date, end_date)
-                
-                # Guardar noticias en la base de datos
-                total_processed, new_saved = self.db.save_news(news_list, symbol)
-                
-                results[symbol] = {
-                    'total_collected': len(news_list),
-                    'new_saved': new_saved
-                }
-                
-                logger.info(f"Recopiladas {len(news_list)} noticias para {symbol}, {new_saved} nuevas guardadas en la base de datos")
-                
-                # Esperar para no sobrepasar límites de la API
-                time.sleep(1)
-                
-            except Exception as e:
-                logger.error(f"Error al recopilar noticias para {symbol}: {str(e)}")
-                results[symbol] = {'error': str(e)}
+        start_dates = {company['symbol']: start_date for company in self.companies}
+        return asyncio.run(self._collect_all_companies(start_dates, end_date, 'Recopiladas'))
+    
+    def _build_historical_delta(self, value, unit):
+        """
+        Convierte el periodo histórico configurado en un intervalo de tiempo.
         
-        return results
+        Args:
+            value (int): Número de unidades del periodo.
+            unit (str): Unidad del periodo ('years', 'months', 'weeks', 'days').
+            
+        Returns:
+            timedelta: Duración del periodo histórico.
+            
+        Raises:
+            ValueError: Si la unidad no está soportada.
+        """
+        if unit == 'years':
+            return timedelta(days=365 * value)
+        elif unit == 'months':
+            return timedelta(days=28 * value)
+        elif unit == 'weeks':
+            return timedelta(weeks=value)
+        elif unit == 'days':
+            return timedelta(days=value)
+        
+        raise ValueError(f"Unidad de periodo histórico no soportada: {unit}")
     
     def update_news(self, days_back=7):
         """
@@ -134,103 +169,366 @@ class NewsCollector:
             logger.error("No se puede actualizar noticias sin una API key válida.")
             return {}
         
+        # Calcular fechas
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=days_back)
+        
+        # Las fechas de publicación se guardan en UTC sin zona horaria
+        now_utc = datetime.now(timezone.utc).replace(tzinfo=None)
+        latest = self.db.latest_published_by_symbol([company['symbol'] for company in self.companies])
+        
+        start_dates = {}
         results = {}
         
         for company in self.companies:
             symbol = company['symbol']
-            name = company['name']
-            
-            logger.info(f"Actualizando noticias para {name} ({symbol})...")
-            
-            try:
-                # Calcular fechas
-                end_date = datetime.now()
-                start_date = end_date - timedelta(days=days_back)
-                
-                # Recopilar noticias
-                news_list = self._collect_news_for_period(symbol, name, start_date, end_date)
-                
-                # Guardar noticias en la base de datos
-                total_processed, new_saved = self.db.save_news(news_list, symbol)
-                
-                results[symbol] = {
-                    'total_collected': len(news_list),
-                    'new_saved': new_saved
-                }
-                
-                logger.info(f"Actualizadas {len(news_list)} noticias para {symbol}, {new_saved} nuevas guardadas en la base de datos")
-                
-                # Esperar para no sobrepasar límites de la API
-                time.sleep(1)
-                
-            except Exception as e:
-                logger.error(f"Error al actualizar noticias para {symbol}: {str(e)}")
-                results[symbol] = {'error': str(e)}
+            last = latest.get(symbol)
+            
+            if last is None:
+                start_dates[symbol] = start_date
+            elif now_utc - last < self.freshness_window:
+                # Noticias recientes en la base de datos: no gastar cuota de la API
+                logger.info(f"Noticias de {symbol} al día (última: {last}), se omite la consulta")
+                results[symbol] = {'total_collected': 0, 'new_saved': 0}
+            else:
+                # Pedir solo desde la última noticia guardada (con margen de una hora)
+                start_dates[symbol] = max(start_date, last - timedelta(hours=1))
+        
+        if start_dates:
+            results.update(asyncio.run(self._collect_all_companies(start_dates, end_date, 'Actualizadas')))
         
         return results
     
-    def _collect_news_for_period(self, symbol, company_name, start_date, end_date):
+    async def _collect_all_companies(self, start_dates, end_date, action):
         """
-        Recopila noticias para una empresa en un periodo específico.
+        Recopila en paralelo las noticias de todas las empresas, agrupando varias
+        empresas en cada consulta, y las guarda en la base de datos.
         
         Args:
-            symbol (str): Símbolo de la empresa.
-            company_name (str): Nombre de la empresa.
-            start_date (datetime): Fecha de inicio.
+            start_dates (dict): Fecha de inicio por símbolo de las empresas a recopilar.
             end_date (datetime): Fecha de fin.
+            action (str): Verbo para los mensajes de log ('Recopiladas', 'Actualizadas').
             
         Returns:
-            list: Lista de noticias recopiladas.
+            dict: Resultados por símbolo de empresa.
         """
-        all_news = []
+        # Limitar peticiones simultáneas y por minuto a la API de noticias
+        semaphore = asyncio.Semaphore(self.concurrency)
+        rate_limiter = AsyncLimiter(self.requests_per_minute, 60)
+        
+        companies = [company for company in self.companies if company['symbol'] in start_dates]
         
-        # Convertir fechas a formato YYYY-MM-DD
-        from_date = start_date.strftime('%Y-%m-%d')
+        # Convertir fechas a formato YYYY-MM-DD y fijar el timestamp de recopilación una vez
         to_date = end_date.strftime('%Y-%m-%d')
+        collected_at = end_date.isoformat()
         
-        # Buscar por nombre de la empresa
-        try:
-            response = self.newsapi.get_everything(
-                q=company_name,
-                from_param=from_date,
-                to=to_date,
-                language='en',
-                sort_by='relevancy',
-                page_size=100
-            )
-            
-            if response['status'] == 'ok':
-                # Añadir noticias a la lista
-                for article in response['articles']:
-                    # Añadir timestamp de recopilación
-                    article['collected_at'] = datetime.now().isoformat()
-                    all_news.append(article)
-        except Exception as e:
-            logger.error(f"Error al buscar noticias por nombre de empresa: {str(e)}")
+        # Cada bloque empieza en la fecha más antigua que necesita alguna de sus empresas
+        chunks = [
+            (chunk, min(start_dates[company['symbol']] for company in chunk).strftime('%Y-%m-%d'))
+            for chunk in self._chunk_companies(companies)
+        ]
+        
+        # Un único cliente con conexiones persistentes reutilizadas entre todas las consultas
+        client = httpx.AsyncClient(
+            headers={'X-Api-Key': self.api_key},
+            timeout=30,
+            limits=httpx.Limits(
+                max_connections=self.concurrency,
+                max_keepalive_connections=self.concurrency
+            ),
+            transport=httpx.AsyncHTTPTransport(retries=3)
+        )
+        
+        async with client:
+            chunk_results = await asyncio.gather(*[
+                self._collect_news_for_companies(
+                    client, semaphore, rate_limiter, chunk, from_date, to_date, collected_at
+                )
+                for chunk, from_date in chunks
+            ])
+        
+        news_by_symbol = {}
+        for chunk_news in chunk_results:
+            news_by_symbol.update(chunk_news)
+        
+        collected = {symbol: len(news_list) for symbol, news_list in news_by_symbol.items()}
+        
+        # Descartar las noticias ya guardadas en ejecuciones anteriores (con un día de margen)
+        known_urls = self.db.get_known_urls(
+            [company['symbol'] for company in companies],
+            min(start_dates.values()) - timedelta(days=1)
+        )
+        
+        # Guardar las noticias de todas las empresas con una sola inserción
+        saved = self.db.save_news_bulk([
+            (company['symbol'], [
+                article for article in news_by_symbol.get(company['symbol'], [])
+                if (company['symbol'], article['url']) not in known_urls
+            ])
+            for company in companies
+        ])
+        
+        results = {}
+        
+        for company in companies:
+            symbol = company['symbol']
+            total_collected = collected.get(symbol, 0)
+            new_saved = saved.get(symbol, (0, 0))[1]
+            
+            results[symbol] = {
+                'total_collected': total_collected,
+                'new_saved': new_saved
+            }
+            
+            logger.info(f"{action} {total_collected} noticias para {symbol}, {new_saved} nuevas guardadas en la base de datos")
+        
+        return results
+    
+    def _chunk_companies(self, companies):
+        """
+        Agrupa las empresas en bloques que caben en una sola consulta a la API.
+        
+        Args:
+            companies (list): Empresas con 'symbol' y 'name'.
+            
+        Returns:
+            list: Bloques de empresas.
+        """
+        chunks = []
+        chunk = []
+        
+        for company in companies:
+            candidate = chunk + [company]
+            
+            if chunk and (len(candidate) > MAX_COMPANIES_PER_QUERY
+                          or len(self._build_batch_query(candidate)) > MAX_QUERY_LENGTH):
+                chunks.append(chunk)
+                chunk = [company]
+            else:
+                chunk = candidate
+        
+        if chunk:
+            chunks.append(chunk)
+        
+        return chunks
+    
+    def _build_batch_query(self, companies):
+        """
+        Construye una consulta que busca el nombre o el símbolo de varias empresas.
+        
+        Args:
+            companies (list): Empresas con 'symbol' y 'name'.
+            
+        Returns:
+            str: Consulta para el parámetro 'q' de la API.
+        """
+        return ' OR '.join(f'"{_search_name(company["name"])}" OR "{company["symbol"]}"' for company in companies)
+    
+    async def _collect_news_for_companies(self, client, semaphore, rate_limiter, companies, from_date, to_date, collected_at):
+        """
+        Recopila noticias para un bloque de empresas con una sola consulta y las
+        reparte entre las empresas que mencionan.
+        
+        Args:
+            client (httpx.AsyncClient): Cliente HTTP compartido.
+            semaphore (asyncio.Semaphore): Límite de peticiones simultáneas.
+            rate_limiter (AsyncLimiter): Límite de peticiones por minuto.
+            companies (list): Empresas con 'symbol' y 'name'.
+            from_date (str): Fecha de inicio (YYYY-MM-DD).
+            to_date (str): Fecha de fin (YYYY-MM-DD).
+            collected_at (str): Timestamp de recopilación en formato ISO.
+            
+        Returns:
+            dict: Lista de noticias recopiladas por símbolo de empresa.
+        """
+        for company in companies:
+            logger.info(f"Recopilando noticias para {company['name']} ({company['symbol']})...")
+        
+        articles = await self._fetch_articles(
+            client, semaphore, rate_limiter, self._build_batch_query(companies), from_date, to_date
+        )
+        
+        news_by_symbol = {company['symbol']: [] for company in companies}
+        seen_urls = {company['symbol']: set() for company in companies}
+        names = [(company['symbol'], _search_name(company['name']).lower()) for company in companies]
+        
+        # Con una sola empresa todas las noticias de la consulta son suyas
+        single_company = len(companies) == 1
+        
+        for article in articles:
+            title = article.get('title') or ''
+            text = "" if single_company else " ".join(
+                (title, article.get('description') or '', article.get('content') or '')
+            ).lower()
+            
+            # Asignar la noticia a cada empresa cuyo nombre o símbolo aparece (la API también
+            # busca en el contenido), evitando duplicados
+            for symbol, name in names:
+                mentioned = single_company or name in text or symbol in title
+                if mentioned and article['url'] not in seen_urls[symbol]:
+                    article['collected_at'] = collected_at
+                    seen_urls[symbol].add(article['url'])
+                    news_by_symbol[symbol].append(article)
+        
+        return news_by_symbol
+    
+    async def _fetch_articles(self, client, semaphore, rate_limiter, query, from_date, to_date):
+        """
+        Busca noticias en la API de noticias, usando la caché para los días ya cerrados.
+        
+        Si el periodo incluye el día de hoy, los días anteriores se consultan en la
+        caché y solo el día de hoy se pide siempre a la API.
+        
+        Args:
+            client (httpx.AsyncClient): Cliente HTTP compartido.
+            semaphore (asyncio.Semaphore): Límite de peticiones simultáneas.
+            rate_limiter (AsyncLimiter): Límite de peticiones por minuto.
+            query (str): Texto a buscar.
+            from_date (str): Fecha de inicio (YYYY-MM-DD).
+            to_date (str): Fecha de fin (YYYY-MM-DD).
+            
+        Returns:
+            list: Artículos encontrados, o lista vacía si hay error.
+        """
+        today = date.today().isoformat()
+        
+        if to_date < today:
+            return await self._fetch_cached_articles(client, semaphore, rate_limiter, query, from_date, to_date)
+        
+        if from_date >= today:
+            return await self._request_articles(client, semaphore, rate_limiter, query, from_date, to_date) or []
+        
+        yesterday = (date.today() - timedelta(days=1)).isoformat()
+        historical_articles, today_articles = await asyncio.gather(
+            self._fetch_cached_articles(client, semaphore, rate_limiter, query, from_date, yesterday),
+            self._request_articles(client, semaphore, rate_limiter, query, today, today)
+        )
+        
+        return historical_articles + (today_articles or [])
+    
+    async def _fetch_cached_articles(self, client, semaphore, rate_limiter, query, from_date, to_date):
+        """
+        Busca noticias en la caché en disco y, si no están, en la API de noticias.
+        
+        Args:
+            client (httpx.AsyncClient): Cliente HTTP compartido.
+            semaphore (asyncio.Semaphore): Límite de peticiones simultáneas.
+            rate_limiter (AsyncLimiter): Límite de peticiones por minuto.
+            query (str): Texto a buscar.
+            from_date (str): Fecha de inicio (YYYY-MM-DD).
+            to_date (str): Fecha de fin (YYYY-MM-DD).
+            
+        Returns:
+            list: Artículos encontrados, o lista vacía si hay error.
+        """
+        params = self._build_params(query, from_date, to_date)
+        cache_key = hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+        
+        articles = self.api_cache.get(cache_key)
+        if articles is not None:
+            return articles
+        
+        articles = await self._request_articles(client, semaphore, rate_limiter, query, from_date, to_date)
+        
+        # Solo se guardan en caché las respuestas correctas
+        if articles is None:
+            return []
+        
+        self.api_cache.set(cache_key, articles, expire=API_CACHE_EXPIRE)
+        return articles
+    
+    async def _request_articles(self, client, semaphore, rate_limiter, query, from_date, to_date):
+        """
+        Pide noticias a la API de noticias, recorriendo todas las páginas de resultados.
+        
+        Args:
+            client (httpx.AsyncClient): Cliente HTTP compartido.
+            semaphore (asyncio.Semaphore): Límite de peticiones simultáneas.
+            rate_limiter (AsyncLimiter): Límite de peticiones por minuto.
+            query (str): Texto a buscar.
+            from_date (str): Fecha de inicio (YYYY-MM-DD).
+            to_date (str): Fecha de fin (YYYY-MM-DD).
+            
+        Returns:
+            list: Artículos encontrados, o None si hay error.
+        """
+        first_page = await self._request_page(client, semaphore, rate_limiter, query, from_date, to_date, 1)
+        
+        if first_page is None:
+            return None
+        
+        articles = first_page['articles']
+        
+        # El resto de páginas se piden en paralelo una vez conocido el total
+        pages = min(math.ceil(first_page.get('totalResults', 0) / PAGE_SIZE), self.max_pages)
+        
+        if pages > 1:
+            other_pages = await asyncio.gather(*[
+                self._request_page(client, semaphore, rate_limiter, query, from_date, to_date, page)
+                for page in range(2, pages + 1)
+            ])
+            
+            # Una página fallida no invalida las ya recibidas
+            for data in other_pages:
+                if data is not None:
+                    articles.extend(data['articles'])
+        
+        return articles
+    
+    async def _request_page(self, client, semaphore, rate_limiter, query, from_date, to_date, page):
+        """
+        Pide una página de resultados a la API de noticias.
+        
+        Args:
+            client (httpx.AsyncClient): Cliente HTTP compartido.
+            semaphore (asyncio.Semaphore): Límite de peticiones simultáneas.
+            rate_limiter (AsyncLimiter): Límite de peticiones por minuto.
+            query (str): Texto a buscar.
+            from_date (str): Fecha de inicio (YYYY-MM-DD).
+            to_date (str): Fecha de fin (YYYY-MM-DD).
+            page (int): Número de página (empezando en 1).
+            
+        Returns:
+            dict: Respuesta de la API, o None si hay error.
+        """
+        params = self._build_params(query, from_date, to_date)
+        params['page'] = page
         
-        # Buscar por símbolo de la empresa
         try:
-            response = self.newsapi.get_everything(
-                q=symbol,
-                from_param=from_date,
-                to=to_date,
-                language='en',
-                sort_by='relevancy',
-                page_size=100
-            )
-            
-            if response['status'] == 'ok':
-                # Añadir noticias a la lista, evitando duplicados
-                for article in response['articles']:
-                    # Verificar si la noticia ya está en la lista
-                    if not any(news['url'] == article['url'] for news in all_news):
-                        # Añadir timestamp de recopilación
-                        article['collected_at'] = datetime.now().isoformat()
-                        all_news.append(article)
+            async with semaphore, rate_limiter:
+                response = await client.get(self.everything_url, params=params)
+            
+            data = response.json()
+            
+            if data.get('status') == 'ok':
+                return data
+            
+            logger.error(f"Error al buscar noticias para '{query}' (página {page}): {data.get('message', response.status_code)}")
         except Exception as e:
-            logger.error(f"Error al buscar noticias por símbolo: {str(e)}")
+            logger.error(f"Error al buscar noticias para '{query}' (página {page}): {str(e)}")
+        
+        return None
+    
+    def _build_params(self, query, from_date, to_date):
+        """
+        Construye los parámetros de búsqueda de la API de noticias.
         
-        return all_news
+        Args:
+            query (str): Texto a buscar.
+            from_date (str): Fecha de inicio (YYYY-MM-DD).
+            to_date (str): Fecha de fin (YYYY-MM-DD).
+            
+        Returns:
+            dict: Parámetros de la petición.
+        """
+        return {
+            'q': query,
+            'from': from_date,
+            'to': to_date,
+            'language': self.language,
+            'sortBy': 'relevancy',
+            'pageSize': PAGE_SIZE
+        }
 
 if __name__ == "__main__":
     # Crear instancia del recopilador y recopilar noticias
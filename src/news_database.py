@@ -7,14 +7,32 @@ Proporciona funciones para crear, actualizar y consultar la base de datos de not
 """
 
 import os
+import re
 import sys
 import yaml
-import json
+import atexit
+import queue
 import duckdb
 import pandas as pd
-from datetime import datetime, timedelta
+import pyarrow as pa
+from datetime import datetime, timedelta, timezone
+from contextlib import contextmanager
+from collections import Counter
+from functools import lru_cache
 import logging
 
+# Usar el cargador de YAML en C (libyaml) si está disponible
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# ciso8601 es opcional: si está instalado se usa para los formatos poco habituales
+try:
+    import ciso8601
+except ImportError:
+    ciso8601 = None
+
 # Configurar logging
 logging.basicConfig(
     level=logging.INFO,
@@ -26,6 +44,217 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Caché de configuraciones ya parseadas, por (ruta, fecha de modificación, tamaño)
+_CONFIG_CACHE = {}
+
+# Esquema de las noticias insertadas en bloque. El ID no viaja en el lote: lo calcula
+# DuckDB a partir del símbolo, la URL y la fecha de publicación original (published_raw)
+NEWS_BATCH_SCHEMA = pa.schema([
+    ('symbol', pa.string()),
+    ('title', pa.string()),
+    ('description', pa.string()),
+    ('content', pa.string()),
+    ('url', pa.string()),
+    ('published_raw', pa.string()),
+    ('published_at', pa.timestamp('us')),
+    ('source_name', pa.string()),
+    ('source_url', pa.string()),
+    ('collected_at', pa.timestamp('us')),
+    ('relevance', pa.float32())
+])
+
+# Inserción de un lote registrado como 'news_batch' con un anti-join contra las noticias
+# ya existentes. El ID (estable entre procesos, a diferencia de hash() de Python) se
+# calcula vectorizado en DuckDB. Devuelve el símbolo de cada fila insertada para contar las nuevas.
+# Las fechas se truncan al segundo antes de guardarlas como TIMESTAMP_S, ya que la
+# conversión directa redondea (10:00:00.5 pasaría a 10:00:01, e incluso al día siguiente).
+# Además del ID se descartan las noticias con la misma empresa, URL y fecha: las guardadas
+# por versiones anteriores tienen IDs calculados con hash() que nunca coinciden con el md5
+INSERT_NEWS_BATCH_SQL = """
+    INSERT INTO news 
+    (id, symbol, title, description, content, url, published_at, source_name, source_url, collected_at, relevance)
+    WITH batch AS (
+        SELECT
+            symbol || '_' || left(md5(coalesce(url, '') || coalesce(published_raw, '')), 16) AS id,
+            * EXCLUDE (published_raw, published_at, collected_at),
+            date_trunc('second', published_at) AS published_at,
+            date_trunc('second', collected_at) AS collected_at
+        FROM news_batch
+    )
+    SELECT DISTINCT ON (id)
+        id, symbol, title, description, content, url, published_at, source_name, source_url, collected_at, relevance
+    FROM batch
+    WHERE NOT EXISTS (SELECT 1 FROM news WHERE news.id = batch.id)
+    AND NOT EXISTS (
+        SELECT 1 FROM news
+        WHERE news.symbol = batch.symbol AND news.url = batch.url AND news.published_at = batch.published_at
+    )
+    ON CONFLICT DO NOTHING
+    RETURNING symbol
+"""
+
+# Migración de los ficheros *_news.json leídos directamente por DuckDB. El símbolo sale
+# del nombre del fichero; el ID, las fechas y la deduplicación son los de INSERT_NEWS_BATCH_SQL.
+MIGRATE_JSON_SQL = """
+    INSERT INTO news 
+    (id, symbol, title, description, content, url, published_at, source_name, source_url, collected_at, relevance)
+    WITH raw_news AS (
+        SELECT *, split_part(parse_filename(filename), '_', 1) AS symbol
+        FROM read_json(?, format = 'array', filename = true, union_by_name = true, columns = {
+            'title': 'VARCHAR', 'description': 'VARCHAR', 'content': 'VARCHAR', 'url': 'VARCHAR',
+            'publishedAt': 'VARCHAR', 'source': 'STRUCT(name VARCHAR, url VARCHAR)',
+            'collected_at': 'VARCHAR', 'relevance': 'DOUBLE'
+        })
+    ),
+    news_batch AS (
+        SELECT
+            symbol || '_' || left(md5(coalesce(url, '') || coalesce(publishedAt, '')), 16) AS id,
+            symbol, title, description, content, url,
+            date_trunc('second', coalesce(TRY_CAST(publishedAt AS TIMESTAMPTZ) AT TIME ZONE 'UTC', localtimestamp)) AS published_at,
+            source.name AS source_name,
+            source.url AS source_url,
+            date_trunc('second', coalesce(TRY_CAST(collected_at AS TIMESTAMPTZ) AT TIME ZONE 'UTC', localtimestamp)) AS collected_at,
+            coalesce(relevance, 0.5) AS relevance
+        FROM raw_news
+    )
+    SELECT DISTINCT ON (id)
+        id, symbol, title, description, content, url, published_at, source_name, source_url, collected_at, relevance
+    FROM news_batch
+    WHERE NOT EXISTS (SELECT 1 FROM news WHERE news.id = news_batch.id)
+    AND NOT EXISTS (
+        SELECT 1 FROM news
+        WHERE news.symbol = news_batch.symbol AND news.url = news_batch.url AND news.published_at = news_batch.published_at
+    )
+    ON CONFLICT DO NOTHING
+    RETURNING symbol
+"""
+
+# Columnas de la tabla de noticias y columnas que devuelven los getters por defecto:
+# todas salvo 'content', que es la más pesada y casi nunca se usa al leer
+NEWS_COLUMNS = (
+    'id', 'symbol', 'published_at', 'title', 'url', 'source_name', 'source_url',
+    'collected_at', 'relevance', 'description', 'content'
+)
+SUMMARY_COLUMNS = tuple(column for column in NEWS_COLUMNS if column != 'content')
+
+# Amplitud de cada rango de contexto; para 'all' se usa una fecha muy antigua
+CONTEXT_DELTAS = {
+    'week': timedelta(days=7),
+    'month': timedelta(days=30),
+    'year': timedelta(days=365)
+}
+CONTEXT_EPOCH = datetime(1970, 1, 1)
+
+# Columnas que necesita format_context_for_prompt
+CONTEXT_COLUMNS = ('published_at', 'title')
+
+# Consulta de las últimas noticias de contexto de una empresa
+HISTORICAL_CONTEXT_SQL = """
+    SELECT {columns} FROM news 
+    WHERE symbol = ? 
+    AND published_at >= ? 
+    AND published_at < ?
+    ORDER BY published_at DESC
+    LIMIT 10
+"""
+
+# El índice de texto completo se guarda en la base de datos junto con el número de
+# noticias que indexó; está desactualizado si ese número ya no coincide
+FTS_STATE_SQL = "CREATE TABLE IF NOT EXISTS news_fts_state (news_count BIGINT)"
+FTS_STALE_SQL = """
+    SELECT (SELECT COUNT(*) FROM news) IS DISTINCT FROM (SELECT max(news_count) FROM news_fts_state)
+"""
+
+# Formato habitual de las fechas de la API: 2024-01-31T12:34:56(.123)Z
+ISO_UTC_PATTERN = re.compile(r'(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d+))?Z?')
+
+@lru_cache(maxsize=8192)
+def _parse_iso(value):
+    """
+    Convierte una fecha ISO 8601 en datetime UTC sin zona horaria.
+    
+    Las fechas se repiten mucho entre noticias, por lo que el resultado se cachea.
+    
+    Args:
+        value (str): Fecha en formato ISO 8601.
+        
+    Returns:
+        datetime: Fecha en UTC sin zona horaria, o None si no se puede interpretar.
+    """
+    try:
+        # Camino rápido para el formato habitual, sin pasar por el parser completo
+        match = ISO_UTC_PATTERN.fullmatch(value)
+        if match:
+            year, month, day, hour, minute, second, fraction = match.groups()
+            microsecond = int(fraction[:6].ljust(6, '0')) if fraction else 0
+            return datetime(int(year), int(month), int(day), int(hour), int(minute), int(second), microsecond)
+        
+        if ciso8601 is not None:
+            parsed = ciso8601.parse_datetime(value)
+        else:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def _select_columns(columns):
+    """
+    Construye la lista de columnas de un SELECT, validándolas contra la tabla.
+    
+    Args:
+        columns (iterable): Nombres de las columnas a devolver.
+        
+    Returns:
+        str: Columnas separadas por comas.
+        
+    Raises:
+        ValueError: Si alguna columna no existe en la tabla de noticias.
+    """
+    unknown = set(columns) - set(NEWS_COLUMNS)
+    if unknown:
+        raise ValueError(f"Columnas desconocidas: {sorted(unknown)}")
+    return ', '.join(columns)
+
+def _build_news_row(news, symbol, collected_at):
+    """
+    Construye la fila de la tabla de noticias para una noticia de la API.
+    
+    Args:
+        news (dict): Noticia tal como la devuelve la API.
+        symbol (str): Símbolo de la empresa.
+        collected_at (datetime): Fecha de recopilación.
+        
+    Returns:
+        dict: Valores de la fila por columna.
+    """
+    # Convertir fecha de publicación a formato datetime (UTC, sin zona horaria)
+    published_raw = news.get('publishedAt')
+    published_at = published_raw
+    if isinstance(published_at, str):
+        published_at = _parse_iso(published_at)
+    if not published_at:
+        published_at = datetime.now()
+    
+    # Extraer información de la fuente
+    source = news.get('source') or {}
+    
+    return {
+        'symbol': symbol,
+        'title': news.get('title', ''),
+        'description': news.get('description', ''),
+        'content': news.get('content', ''),
+        'url': news.get('url', ''),
+        'published_raw': published_raw if isinstance(published_raw, str) else None,
+        'published_at': published_at,
+        'source_name': source.get('name', ''),
+        'source_url': source.get('url', ''),
+        'collected_at': collected_at,
+        'relevance': news.get('relevance', 0.5)
+    }
+
 class NewsDatabase:
     """Clase para gestionar la base de datos DuckDB de noticias."""
     
@@ -50,6 +279,9 @@ class NewsDatabase:
         # Crear directorio de datos si no existe
         os.makedirs(self.data_dir, exist_ok=True)
         
+        # Cursores libres para reutilizar entre consultas (también desde varios hilos)
+        self._cursor_pool = queue.SimpleQueue()
+        
         # Inicializar la base de datos
         self._init_database()
     
@@ -63,40 +295,66 @@ class NewsDatabase:
         Returns:
             dict: Configuración cargada.
         """
-        with open(config_path, 'r', encoding='utf-8') as file:
-            return yaml.safe_load(file)
+        # Reutilizar la configuración parseada mientras el archivo no cambie
+        stat = os.stat(config_path)
+        cache_key = (os.path.abspath(config_path), stat.st_mtime_ns, stat.st_size)
+        
+        if cache_key not in _CONFIG_CACHE:
+            with open(config_path, 'r', encoding='utf-8') as file:
+                _CONFIG_CACHE[cache_key] = yaml.load(file, Loader=SafeLoader)
+        
+        return _CONFIG_CACHE[cache_key]
     
     def _init_database(self):
         """
         Inicializa la base de datos DuckDB y crea las tablas necesarias si no existen.
         """
         try:
-            # Conectar a la base de datos
-            conn = duckdb.connect(self.db_path)
-            
-            # Crear tabla de noticias si no existe
-            conn.execute("""
+            # Conexión única y duradera: cada operación usa su propio cursor sobre ella
+            self.conn = duckdb.connect(self.db_path)
+            atexit.register(self.conn.close)
+            
+            # Ajustes de rendimiento: sin orden de inserción garantizado (las consultas ya
+            # ordenan explícitamente) y límites de memoria/hilos opcionales desde la configuración
+            db_config = self.config.get('database', {})
+            self.conn.execute("SET preserve_insertion_order = false")
+            if db_config.get('memory_limit'):
+                self.conn.execute(f"SET memory_limit = '{db_config['memory_limit']}'")
+            if db_config.get('threads'):
+                self.conn.execute(f"SET threads = {int(db_config['threads'])}")
+            
+            # Crear tabla de noticias si no existe. Las columnas van de más a menos consultadas
+            # y las fechas se guardan con precisión de segundos (los textos ya se comprimen
+            # automáticamente con FSST/ZSTD al hacer checkpoint). El símbolo se mantiene como
+            # VARCHAR y no como ENUM: DuckDB ya lo guarda con compresión de diccionario, y un
+            # ENUM no admite empresas nuevas en la configuración ni las de ficheros migrados
+            self.conn.execute("""
                 CREATE TABLE IF NOT EXISTS news (
                     id VARCHAR PRIMARY KEY,
                     symbol VARCHAR,
+                    published_at TIMESTAMP_S,
                     title VARCHAR,
-                    description VARCHAR,
-                    content VARCHAR,
                     url VARCHAR,
-                    published_at TIMESTAMP,
                     source_name VARCHAR,
                     source_url VARCHAR,
-                    collected_at TIMESTAMP,
-                    relevance FLOAT
+                    collected_at TIMESTAMP_S,
+                    relevance FLOAT,
+                    description VARCHAR,
+                    content VARCHAR
                 )
             """)
             
-            # Crear índices para búsquedas eficientes
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_news_symbol ON news(symbol)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_news_published_at ON news(published_at)")
+            # Crear índices para búsquedas eficientes: las lecturas filtran por empresa
+            # y ordenan por fecha, así que un índice compuesto sustituye al de símbolo
+            self.conn.execute("DROP INDEX IF EXISTS idx_news_symbol")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_news_sym_pub ON news(symbol, published_at DESC)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_news_published_at ON news(published_at)")
             
-            # Cerrar conexión
-            conn.close()
+            # Índice de texto completo para search_news; persiste entre procesos y solo se
+            # reconstruye al buscar si hay noticias que no indexó
+            self.conn.execute(FTS_STATE_SQL)
+            self.fts_available = self._load_fts_extension()
+            self._fts_stale = self.fts_available and self.conn.execute(FTS_STALE_SQL).fetchone()[0]
             
             logger.info("Base de datos inicializada correctamente")
             
@@ -104,6 +362,53 @@ class NewsDatabase:
             logger.error(f"Error al inicializar la base de datos: {str(e)}")
             raise
     
+    def _load_fts_extension(self):
+        """
+        Carga la extensión fts de DuckDB (la instala solo si aún no está instalada).
+        
+        Returns:
+            bool: True si la extensión está disponible.
+        """
+        try:
+            self.conn.execute("LOAD fts")
+            return True
+        except Exception:
+            pass
+        
+        # INSTALL necesita red, así que solo se intenta si la extensión no se pudo cargar
+        try:
+            self.conn.execute("INSTALL fts")
+            self.conn.execute("LOAD fts")
+            return True
+        except Exception as e:
+            logger.warning(f"Extensión fts no disponible, las búsquedas usarán LIKE: {str(e)}")
+            return False
+    
+    @contextmanager
+    def _cursor(self):
+        """
+        Presta un cursor de la conexión compartida y lo devuelve al terminar.
+        
+        Cada cursor tiene su propio estado de consulta, por lo que varios hilos
+        pueden leer en paralelo aprovechando el control de concurrencia de DuckDB.
+        
+        Yields:
+            duckdb.DuckDBPyConnection: Cursor sobre la conexión compartida.
+        """
+        try:
+            cursor = self._cursor_pool.get_nowait()
+        except queue.Empty:
+            cursor = self.conn.cursor()
+        
+        try:
+            yield cursor
+        except BaseException:
+            # Un cursor que ha fallado (p. ej. con una transacción abierta) no se reutiliza
+            cursor.close()
+            raise
+        
+        self._cursor_pool.put(cursor)
+    
     def migrate_from_json(self, news_dir):
         """
         Migra los datos de noticias desde archivos JSON a la base de datos DuckDB.
@@ -115,75 +420,24 @@ class NewsDatabase:
             int: Número de noticias migradas.
         """
         try:
-            # Conectar a la base de datos
-            conn = duckdb.connect(self.db_path)
-            
-            # Contador de noticias migradas
-            total_migrated = 0
-            
-            # Recorrer archivos JSON en el directorio
-            for filename in os.listdir(news_dir):
-                if filename.endswith('_news.json'):
-                    # Extraer símbolo de la empresa del nombre del archivo
-                    symbol = filename.split('_')[0]
-                    
-                    # Ruta completa al archivo JSON
-                    json_path = os.path.join(news_dir, filename)
-                    
-                    # Cargar noticias desde el archivo JSON
-                    with open(json_path, 'r', encoding='utf-8') as f:
-                        news_list = json.load(f)
-                    
-                    # Migrar cada noticia a la base de datos
-                    for news in news_list:
-                        # Generar ID único para la noticia
-                        news_id = f"{symbol}_{hash(news.get('url', '') + news.get('publishedAt', ''))}"
-                        
-                        # Convertir fecha de publicación a formato datetime
-                        published_at = news.get('publishedAt', '')
-                        if isinstance(published_at, str):
-                            try:
-                                published_at = datetime.fromisoformat(published_at.replace('Z', '+00:00'))
-                            except:
-                                published_at = datetime.now()
-                        
-                        # Convertir fecha de recopilación a formato datetime
-                        collected_at = news.get('collected_at', '')
-                        if isinstance(collected_at, str):
-                            try:
-                                collected_at = datetime.fromisoformat(collected_at.replace('Z', '+00:00'))
-                            except:
-                                collected_at = datetime.now()
-                        elif not collected_at:
-                            collected_at = datetime.now()
-                        
-                        # Extraer información de la fuente
-                        source_name = news.get('source', {}).get('name', '')
-                        source_url = news.get('source', {}).get('url', '')
-                        
-                        # Insertar noticia en la base de datos
-                        conn.execute("""
-                            INSERT OR IGNORE INTO news 
-                            (id, symbol, title, description, content, url, published_at, source_name, source_url, collected_at, relevance)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """, (
-                            news_id,
-                            symbol,
-                            news.get('title', ''),
-                            news.get('description', ''),
-                            news.get('content', ''),
-                            news.get('url', ''),
-                            published_at,
-                            source_name,
-                            source_url,
-                            collected_at,
-                            news.get('relevance', 0.5)
-                        ))
-                        
-                        total_migrated += 1
-            
-            # Cerrar conexión
-            conn.close()
+            if not any(filename.endswith('_news.json') for filename in os.listdir(news_dir)):
+                logger.info("Migración completada: no hay ficheros de noticias en el directorio")
+                return 0
+            
+            with self._cursor() as conn:
+                # Toda la migración en una transacción explícita y un único checkpoint al final
+                conn.execute("BEGIN TRANSACTION")
+                try:
+                    # DuckDB lee y convierte los JSON e inserta las noticias nuevas en una sola sentencia
+                    pattern = os.path.join(news_dir, '*_news.json')
+                    total_migrated = len(conn.execute(MIGRATE_JSON_SQL, [pattern]).fetchall())
+                    conn.execute("COMMIT")
+                    self._fts_stale = self._fts_stale or total_migrated > 0
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                
+                conn.execute("CHECKPOINT")
             
             logger.info(f"Migración completada: {total_migrated} noticias migradas a DuckDB")
             
@@ -204,95 +458,90 @@ class NewsDatabase:
         Returns:
             tuple: (total_saved, new_saved) - Total de noticias procesadas y nuevas noticias guardadas.
         """
+        return self.save_news_bulk([(symbol, news_list)]).get(symbol, (0, 0))
+    
+    def save_news_bulk(self, news_batch):
+        """
+        Guarda las noticias de varias empresas con una sola inserción.
+        
+        Args:
+            news_batch (list): Lista de tuplas (symbol, news_list).
+            
+        Returns:
+            dict: (total_processed, new_saved) por símbolo de empresa.
+        """
         try:
-            # Conectar a la base de datos
-            conn = duckdb.connect(self.db_path)
+            collected_at = datetime.now()
+            columns = {name: [] for name in NEWS_BATCH_SCHEMA.names}
+            results = {}
+            
+            # Claves (símbolo, URL, fecha) ya añadidas al lote: el mismo artículo puede llegar
+            # repetido desde varias fuentes y solo hace falta enviarlo una vez a DuckDB
+            seen = set()
+            
+            for symbol, news_list in news_batch:
+                for news in news_list:
+                    key = (symbol, news.get('url'), news.get('publishedAt'))
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    
+                    for name, value in _build_news_row(news, symbol, collected_at).items():
+                        columns[name].append(value)
+                
+                results[symbol] = (len(news_list), 0)
             
-            # Contadores
-            total_processed = 0
-            new_saved = 0
+            if not columns['symbol']:
+                return results
             
-            # Procesar cada noticia
-            for news in news_list:
-                # Generar ID único para la noticia
-                news_id = f"{symbol}_{hash(news.get('url', '') + news.get('publishedAt', ''))}"
-                
-                # Verificar si la noticia ya existe
-                result = conn.execute(f"SELECT id FROM news WHERE id = '{news_id}'").fetchone()
+            news_table = pa.table(columns, schema=NEWS_BATCH_SCHEMA)
+            
+            with self._cursor() as conn:
+                conn.register('news_batch', news_table)
                 
-                if not result:
-                    # Convertir fecha de publicación a formato datetime
-                    published_at = news.get('publishedAt', '')
-                    if isinstance(published_at, str):
-                        try:
-                            published_at = datetime.fromisoformat(published_at.replace('Z', '+00:00'))
-                        except:
-                            published_at = datetime.now()
-                    
-                    # Extraer información de la fuente
-                    source_name = news.get('source', {}).get('name', '')
-                    source_url = news.get('source', {}).get('url', '')
-                    
-                    # Insertar noticia en la base de datos
-                    conn.execute("""
-                        INSERT INTO news 
-                        (id, symbol, title, description, content, url, published_at, source_name, source_url, collected_at, relevance)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        news_id,
-                        symbol,
-                        news.get('title', ''),
-                        news.get('description', ''),
-                        news.get('content', ''),
-                        news.get('url', ''),
-                        published_at,
-                        source_name,
-                        source_url,
-                        datetime.now(),
-                        news.get('relevance', 0.5)
-                    ))
-                    
-                    new_saved += 1
+                # Insertar todas las noticias nuevas en una sola sentencia y contarlas por empresa
+                new_counts = Counter(symbol for symbol, in conn.execute(INSERT_NEWS_BATCH_SQL).fetchall())
                 
-                total_processed += 1
+                conn.unregister('news_batch')
             
-            # Cerrar conexión
-            conn.close()
+            # El índice de texto completo no se actualiza solo con las inserciones
+            self._fts_stale = self._fts_stale or bool(new_counts)
             
-            logger.info(f"Noticias guardadas para {symbol}: {new_saved} nuevas de {total_processed} procesadas")
+            for symbol, (total_processed, _) in results.items():
+                new_saved = new_counts.get(symbol, 0)
+                results[symbol] = (total_processed, new_saved)
+                logger.info(f"Noticias guardadas para {symbol}: {new_saved} nuevas de {total_processed} procesadas")
             
-            return (total_processed, new_saved)
+            return results
             
         except Exception as e:
             logger.error(f"Error al guardar noticias en la base de datos: {str(e)}")
-            return (0, 0)
+            return {symbol: (0, 0) for symbol, _ in news_batch}
     
-    def get_news_by_symbol(self, symbol, limit=None):
+    def get_news_by_symbol(self, symbol, limit=None, columns=SUMMARY_COLUMNS):
         """
         Obtiene todas las noticias de una empresa.
         
         Args:
             symbol (str): Símbolo de la empresa.
             limit (int, optional): Límite de noticias a obtener.
+            columns (iterable, optional): Columnas a devolver (por defecto, todas salvo 'content').
             
         Returns:
             pandas.DataFrame: DataFrame con las noticias.
         """
         try:
-            # Conectar a la base de datos
-            conn = duckdb.connect(self.db_path)
-            
-            # Construir consulta
-            query = f"SELECT * FROM news WHERE symbol = '{symbol}' ORDER BY published_at DESC"
-            
-            if limit:
-                query += f" LIMIT {limit}"
-            
-            # Ejecutar consulta
-            df = conn.execute(query).fetchdf()
-            
-            # Cerrar conexión
-            conn.close()
+            with self._cursor() as conn:
+                # Construir consulta con parámetros
+                query = f"SELECT {_select_columns(columns)} FROM news WHERE symbol = ? ORDER BY published_at DESC"
+                params = [symbol]
+                
+                if limit:
+                    query += " LIMIT ?"
+                    params.append(limit)
+                
+                # Ejecutar consulta
+                df = conn.execute(query, params).fetchdf()
             
             return df
             
@@ -300,7 +549,7 @@ class NewsDatabase:
             logger.error(f"Error al obtener noticias por símbolo: {str(e)}")
             return pd.DataFrame()
     
-    def get_news_by_date_range(self, symbol, start_date, end_date=None):
+    def get_news_by_date_range(self, symbol, start_date, end_date=None, columns=SUMMARY_COLUMNS):
         """
         Obtiene noticias de una empresa en un rango de fechas.
         
@@ -308,6 +557,7 @@ class NewsDatabase:
             symbol (str): Símbolo de la empresa.
             start_date (datetime): Fecha de inicio.
             end_date (datetime, optional): Fecha de fin. Si no se especifica, se usa la fecha actual.
+            columns (iterable, optional): Columnas a devolver (por defecto, todas salvo 'content').
             
         Returns:
             pandas.DataFrame: DataFrame con las noticias.
@@ -317,20 +567,15 @@ class NewsDatabase:
             if end_date is None:
                 end_date = datetime.now()
             
-            # Conectar a la base de datos
-            conn = duckdb.connect(self.db_path)
-            
-            # Ejecutar consulta
-            df = conn.execute(f"""
-                SELECT * FROM news 
-                WHERE symbol = '{symbol}' 
-                AND published_at >= '{start_date.isoformat()}' 
-                AND published_at <= '{end_date.isoformat()}'
-                ORDER BY published_at DESC
-            """).fetchdf()
-            
-            # Cerrar conexión
-            conn.close()
+            with self._cursor() as conn:
+                # Ejecutar consulta
+                df = conn.execute(f"""
+                    SELECT {_select_columns(columns)} FROM news 
+                    WHERE symbol = ? 
+                    AND published_at >= ? 
+                    AND published_at <= ?
+                    ORDER BY published_at DESC
+                """, [symbol, start_date, end_date]).fetchdf()
             
             return df
             
@@ -338,7 +583,86 @@ class NewsDatabase:
             logger.error(f"Error al obtener noticias por rango de fechas: {str(e)}")
             return pd.DataFrame()
     
-    def get_historical_context(self, symbol, current_date, context_range):
+    def latest_published(self, symbol):
+        """
+        Obtiene la fecha de la noticia más reciente guardada para una empresa.
+        
+        Args:
+            symbol (str): Símbolo de la empresa.
+            
+        Returns:
+            datetime: Fecha de publicación (UTC, sin zona horaria) o None si no hay noticias.
+        """
+        return self.latest_published_by_symbol([symbol]).get(symbol)
+    
+    def latest_published_by_symbol(self, symbols):
+        """
+        Obtiene con una sola consulta la noticia más reciente de varias empresas.
+        
+        Args:
+            symbols (list): Símbolos de las empresas.
+            
+        Returns:
+            dict: Fecha de publicación más reciente por símbolo (solo empresas con noticias).
+        """
+        try:
+            with self._cursor() as conn:
+                rows = conn.execute("""
+                    SELECT symbol, MAX(published_at)
+                    FROM news
+                    WHERE symbol = ANY(?)
+                    GROUP BY symbol
+                """, [list(symbols)]).fetchall()
+            
+            return {symbol: latest for symbol, latest in rows if latest is not None}
+            
+        except Exception as e:
+            logger.error(f"Error al obtener la última noticia guardada: {str(e)}")
+            return {}
+    
+    def get_known_urls(self, symbols, since):
+        """
+        Obtiene las URLs ya guardadas de varias empresas a partir de una fecha.
+        
+        Args:
+            symbols (list): Símbolos de las empresas.
+            since (datetime): Fecha de publicación mínima.
+            
+        Returns:
+            set: Pares (symbol, url) ya presentes en la base de datos.
+        """
+        try:
+            with self._cursor() as conn:
+                rows = conn.execute("""
+                    SELECT DISTINCT symbol, url
+                    FROM news
+                    WHERE symbol = ANY(?) AND published_at >= ?
+                """, [list(symbols), since]).fetchall()
+            
+            return set(rows)
+            
+        except Exception as e:
+            logger.error(f"Error al obtener las URLs guardadas: {str(e)}")
+            return set()
+    
+    def get_context_start_date(self, current_date, context_range):
+        """
+        Calcula la fecha a partir de la cual se buscan noticias de contexto.
+        
+        Args:
+            current_date (datetime): Fecha actual.
+            context_range (str): Rango de contexto ('week', 'month', 'year', 'all').
+            
+        Returns:
+            datetime: Fecha límite inferior del contexto.
+        """
+        if context_range == "all":
+            return CONTEXT_EPOCH
+        
+        # Por defecto, usar una semana
+        return current_date - CONTEXT_DELTAS.get(context_range, CONTEXT_DELTAS['week'])
+    
+    def get_historical_context(self, symbol, current_date, context_range, columns=CONTEXT_COLUMNS):
         """
         Obtiene noticias históricas para proporcionar contexto.
         
@@ -346,46 +670,25 @@ class NewsDatabase:
             symbol (str): Símbolo de la empresa.
             current_date (datetime): Fecha actual.
             context_range (str): Rango de contexto ('week', 'month', 'year', 'all').
+            columns (iterable, optional): Columnas a devolver (por defecto, las del prompt).
             
         Returns:
             pandas.DataFrame: DataFrame con las noticias de contexto.
         """
         try:
             # Determinar la fecha límite según el rango configurado
-            if context_range == "week":
-                limit_date = current_date - timedelta(days=7)
-            elif context_range == "month":
-                limit_date = current_date - timedelta(days=30)
-            elif context_range == "year":
-                limit_date = current_date - timedelta(days=365)
-            elif context_range == "all":
-                # Para 'all', usamos una fecha muy antigua
-                limit_date = datetime(1970, 1, 1)
-            else:
-                # Por defecto, usar una semana
-                limit_date = current_date - timedelta(days=7)
-            
-            # Conectar a la base de datos
-            conn = duckdb.connect(self.db_path)
-            
-            # Ejecutar consulta
-            df = conn.execute(f"""
-                SELECT * FROM news 
-                WHERE symbol = '{symbol}' 
-                AND published_at >= '{limit_date.isoformat()}' 
-                AND published_at < '{current_date.isoformat()}'
-                ORDER BY published_at DESC
-                LIMIT 10
-            """).fetchdf()
-            
-            # Cerrar conexión
-            conn.close()
+            limit_date = self.get_context_start_date(current_date, context_range)
+            
+            with self._cursor() as conn:
+                # Ejecutar consulta
+                query = HISTORICAL_CONTEXT_SQL.format(columns=_select_columns(columns))
+                df = conn.execute(query, [symbol, limit_date, current_date]).fetchdf()
             
             return df
             
         except Exception as e:
             logger.error(f"Error al obtener contexto histórico: {str(e)}")
-            return pd.DataFrame()
+            return pd.DataFrame(columns=list(columns))
     
     def get_news_count(self, symbol=None):
         """
@@ -398,20 +701,12 @@ class NewsDatabase:
             int: Número de noticias.
         """
         try:
-            # Conectar a la base de datos
-            conn = duckdb.connect(self.db_path)
-            
-            # Construir consulta
-            if symbol:
-                query = f"SELECT COUNT(*) FROM news WHERE symbol = '{symbol}'"
-            else:
-                query = "SELECT COUNT(*) FROM news"
-            
-            # Ejecutar consulta
-            count = conn.execute(query).fetchone()[0]
-            
-            # Cerrar conexión
-            conn.close()
+            with self._cursor() as conn:
+                # Ejecutar consulta
+                if symbol:
+                    count = conn.execute("SELECT COUNT(*) FROM news WHERE symbol = ?", [symbol]).fetchone()[0]
+                else:
+                    count = conn.execute("SELECT COUNT(*) FROM news").fetchone()[0]
             
             return count
             
@@ -419,40 +714,77 @@ class NewsDatabase:
             logger.error(f"Error al obtener conteo de noticias: {str(e)}")
             return 0
     
-    def search_news(self, symbol, keywords, limit=10):
+    def get_news_counts_by_symbol(self):
+        """
+        Obtiene con una sola consulta el número de noticias de cada empresa.
+        
+        Returns:
+            dict: Número de noticias por símbolo de empresa.
+        """
+        try:
+            with self._cursor() as conn:
+                rows = conn.execute("SELECT symbol, COUNT(*) FROM news GROUP BY symbol").fetchall()
+            
+            return dict(rows)
+            
+        except Exception as e:
+            logger.error(f"Error al obtener conteo de noticias por empresa: {str(e)}")
+            return {}
+    
+    def search_news(self, symbol, keywords, limit=10, columns=SUMMARY_COLUMNS):
         """
         Busca noticias que contengan palabras clave específicas.
+        Usa el índice de texto completo (BM25) si la extensión fts está disponible.
         
         Args:
             symbol (str): Símbolo de la empresa.
             keywords (str): Palabras clave a buscar.
             limit (int, optional): Límite de noticias a obtener.
+            columns (iterable, optional): Columnas a devolver (por defecto, todas salvo 'content').
             
         Returns:
             pandas.DataFrame: DataFrame con las noticias encontradas.
         """
         try:
-            # Conectar a la base de datos
-            conn = duckdb.connect(self.db_path)
-            
-            # Construir consulta
-            query = f"""
-                SELECT * FROM news 
-                WHERE symbol = '{symbol}' 
-                AND (
-                    title LIKE '%{keywords}%' 
-                    OR description LIKE '%{keywords}%' 
-                    OR content LIKE '%{keywords}%'
-                )
-                ORDER BY published_at DESC
-                LIMIT {limit}
-            """
-            
-            # Ejecutar consulta
-            df = conn.execute(query).fetchdf()
-            
-            # Cerrar conexión
-            conn.close()
+            select_list = _select_columns(columns)
+            
+            with self._cursor() as conn:
+                if self.fts_available:
+                    # Reconstruir el índice solo si se han insertado noticias desde la última vez
+                    if self._fts_stale:
+                        conn.execute("PRAGMA create_fts_index('news', 'id', 'title', 'description', 'content', overwrite = 1)")
+                        conn.execute("DELETE FROM news_fts_state")
+                        conn.execute("INSERT INTO news_fts_state SELECT COUNT(*) FROM news")
+                        self._fts_stale = False
+                    
+                    # Noticias que contienen todas las palabras, ordenadas por relevancia
+                    return conn.execute(f"""
+                        SELECT {select_list}, score FROM (
+                            SELECT *, fts_main_news.match_bm25(id, ?, conjunctive := 1) AS score
+                            FROM news 
+                            WHERE symbol = ?
+                        )
+                        WHERE score IS NOT NULL
+                        ORDER BY score DESC
+                        LIMIT ?
+                    """, [keywords, symbol, limit]).fetchdf()
+                
+                # Escapar los comodines de LIKE para buscar el texto literal
+                escaped = keywords.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                pattern = f"%{escaped}%"
+                
+                # Ejecutar consulta con parámetros
+                df = conn.execute(f"""
+                    SELECT {select_list} FROM news 
+                    WHERE symbol = ? 
+                    AND (
+                        title LIKE ? ESCAPE '\\' 
+                        OR description LIKE ? ESCAPE '\\' 
+                        OR content LIKE ? ESCAPE '\\'
+                    )
+                    ORDER BY published_at DESC
+                    LIMIT ?
+                """, [symbol, pattern, pattern, pattern, limit]).fetchdf()
             
             return df
             
@@ -473,15 +805,11 @@ class NewsDatabase:
         if context_df.empty:
             return "No hay contexto histórico disponible."
         
-        # Formatear el contexto
-        context = "Contexto histórico:\n"
-        
-        for _, row in context_df.iterrows():
-            date_str = row['published_at'].strftime('%Y-%m-%d')
-            title = row['title']
-            context += f"- {date_str}: {title}\n"
-        
-        return context
+        # Fechas formateadas de una vez sobre toda la columna
+        dates = context_df['published_at'].dt.strftime('%Y-%m-%d').to_numpy()
+        titles = context_df['title'].to_numpy()
+        lines = [f"- {date}: {title}" for date, title in zip(dates, titles)]
+        return "Contexto histórico:\n" + "\n".join(lines) + "\n"
 
 if __name__ == "__main__":
     # Ruta al archivo de configuración
@@ -504,8 +832,8 @@ if __name__ == "__main__":
     total_news = db.get_news_count()
     print(f"Total de noticias en la base de datos: {total_news}")
     
-    # Mostrar conteo por empresa
+    # Mostrar conteo por empresa (una sola consulta agrupada)
+    counts = db.get_news_counts_by_symbol()
     for company in db.config['companies']:
         symbol = company['symbol']
-        count = db.get_news_count(symbol)
-        print(f"Noticias para {symbol}: {count}")
+        print(f"Noticias para {symbol}: {counts.get(symbol, 0)}")
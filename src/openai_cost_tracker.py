@@ -9,9 +9,18 @@ Almacena información detallada sobre cada llamada a la API en DuckDB.
 import os
 import sys
 import json
+import atexit
+import queue
+import itertools
+import threading
+import time
 import duckdb
 import pandas as pd
+import pyarrow as pa
 from datetime import datetime
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
 import logging
 import tiktoken
 
@@ -29,6 +38,207 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def _tokenizer_family(model):
+    """
+    Obtiene el modelo de referencia cuyo tokenizer comparte un modelo.
+    
+    Args:
+        model (str): Nombre del modelo de OpenAI.
+        
+    Returns:
+        str: 'gpt-4', 'gpt-3.5-turbo' o None si el modelo es desconocido.
+    """
+    if model.startswith('gpt-4'):
+        return 'gpt-4'
+    if model.startswith('gpt-3.5'):
+        return 'gpt-3.5-turbo'
+    return None
+
+@lru_cache(maxsize=8)
+def _load_tokenizer(family):
+    """
+    Carga el codificador de tokens de una familia de modelos.
+    
+    Args:
+        family (str): Modelo de referencia (ver _tokenizer_family) o None.
+        
+    Returns:
+        tiktoken.Encoding: Codificador de tokens.
+    """
+    if family is None:
+        # Modelo desconocido, usar cl100k_base como fallback
+        return tiktoken.get_encoding("cl100k_base")
+    
+    try:
+        return tiktoken.encoding_for_model(family)
+    except Exception as e:
+        logger.error(f"Error al obtener tokenizer para {family}: {str(e)}")
+        # Usar cl100k_base como fallback
+        return tiktoken.get_encoding("cl100k_base")
+
+def _tokenizer_for(model):
+    """
+    Obtiene el codificador de tokens para un modelo específico.
+    Todas las variantes de una familia (p. ej. gpt-4*) comparten la misma instancia.
+    
+    Args:
+        model (str): Nombre del modelo de OpenAI.
+        
+    Returns:
+        tiktoken.Encoding: Codificador de tokens para el modelo.
+    """
+    return _load_tokenizer(_tokenizer_family(model))
+
+# Caché LRU de recuentos de tokens por (modelo, texto): los prompts de sistema y las
+# plantillas se repiten en muchas llamadas. Se comparte entre hilos y la consultan
+# tanto count_tokens como el recuento en bloque de las llamadas registradas
+TOKEN_CACHE_SIZE = 4096
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
+_token_cache_stats = {'hits': 0, 'misses': 0}
+
+def _count_tokens_cached(model, texts):
+    """
+    Cuenta los tokens de varios textos distintos de un mismo modelo, codificando
+    con tiktoken solo los que no están en la caché (en bloque si son varios).
+    
+    Args:
+        model (str): Modelo para el que contar tokens.
+        texts (list): Textos distintos a contar.
+        
+    Returns:
+        dict: Número de tokens por texto.
+    """
+    counts = {}
+    with _token_cache_lock:
+        for text in texts:
+            count = _token_cache.get((model, text))
+            if count is not None:
+                _token_cache.move_to_end((model, text))
+                counts[text] = count
+        _token_cache_stats['hits'] += len(counts)
+        _token_cache_stats['misses'] += len(texts) - len(counts)
+    
+    missing = [text for text in texts if text not in counts]
+    if not missing:
+        return counts
+    
+    tokenizer = _tokenizer_for(model)
+    if len(missing) == 1:
+        encoded = [tokenizer.encode_ordinary(missing[0])]
+    else:
+        encoded = tokenizer.encode_ordinary_batch(missing)
+    
+    with _token_cache_lock:
+        for text, tokens in zip(missing, encoded):
+            counts[text] = _token_cache[(model, text)] = len(tokens)
+        while len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    
+    return counts
+
+# Columnas de la tabla de costes, en el orden en que se insertan
+COST_COLUMNS = [
+    'id', 'timestamp', 'model', 'prompt_tokens', 'completion_tokens', 'total_tokens',
+    'prompt_cost', 'completion_cost', 'total_cost', 'symbol', 'news_date', 'request_type', 'status'
+]
+
+# Agregado de costes por (día, empresa, modelo) a partir de una tabla con las columnas
+# de openai_costs; mantiene al día la tabla openai_costs_daily
+DAILY_AGGREGATE_SQL = """
+    INSERT INTO openai_costs_daily
+    SELECT 
+        CAST(timestamp AS DATE) AS date,
+        symbol,
+        model,
+        COUNT(*) AS requests,
+        SUM(prompt_tokens) AS prompt_tokens,
+        SUM(completion_tokens) AS completion_tokens,
+        SUM(total_tokens) AS total_tokens,
+        SUM(prompt_cost) AS prompt_cost,
+        SUM(completion_cost) AS completion_cost,
+        SUM(total_cost) AS total_cost
+    FROM {source}
+    {where}
+    GROUP BY ALL
+    ON CONFLICT (date, symbol, model) DO UPDATE SET
+        requests = openai_costs_daily.requests + EXCLUDED.requests,
+        prompt_tokens = openai_costs_daily.prompt_tokens + EXCLUDED.prompt_tokens,
+        completion_tokens = openai_costs_daily.completion_tokens + EXCLUDED.completion_tokens,
+        total_tokens = openai_costs_daily.total_tokens + EXCLUDED.total_tokens,
+        prompt_cost = openai_costs_daily.prompt_cost + EXCLUDED.prompt_cost,
+        completion_cost = openai_costs_daily.completion_cost + EXCLUDED.completion_cost,
+        total_cost = openai_costs_daily.total_cost + EXCLUDED.total_cost
+"""
+
+# Consultas de lectura con texto fijo: los filtros opcionales se pasan como parámetros
+# ($n IS NULL desactiva el filtro y DuckDB lo elimina al enlazar los valores), de modo
+# que cada consulta es siempre la misma cadena y no se construye SQL por llamada
+COSTS_SUMMARY_SQL = """
+    SELECT * FROM openai_costs
+    WHERE ($1::TIMESTAMP IS NULL OR timestamp >= $1)
+      AND ($2::TIMESTAMP IS NULL OR timestamp <= $2)
+      AND ($3::VARCHAR IS NULL OR symbol = $3)
+      AND ($4::VARCHAR IS NULL OR model = $4)
+"""
+
+DAILY_COSTS_SQL = """
+    SELECT 
+        date,
+        SUM(requests)::BIGINT AS requests,
+        SUM(prompt_tokens)::BIGINT AS prompt_tokens,
+        SUM(completion_tokens)::BIGINT AS completion_tokens,
+        SUM(total_tokens)::BIGINT AS total_tokens,
+        SUM(prompt_cost) AS prompt_cost,
+        SUM(completion_cost) AS completion_cost,
+        SUM(total_cost) AS total_cost
+    FROM openai_costs_daily
+    WHERE date >= CURRENT_DATE - CAST($1 AS INTEGER)
+      AND ($2::VARCHAR IS NULL OR symbol = $2)
+    GROUP BY date ORDER BY date DESC
+"""
+
+# Sin filtro de fechas basta con el agregado diario
+COSTS_BY_SYMBOL_DAILY_SQL = """
+    SELECT 
+        symbol,
+        SUM(requests)::BIGINT AS requests,
+        SUM(prompt_tokens)::BIGINT AS prompt_tokens,
+        SUM(completion_tokens)::BIGINT AS completion_tokens,
+        SUM(total_tokens)::BIGINT AS total_tokens,
+        SUM(prompt_cost) AS prompt_cost,
+        SUM(completion_cost) AS completion_cost,
+        SUM(total_cost) AS total_cost
+    FROM openai_costs_daily
+    WHERE symbol != ''
+    GROUP BY symbol ORDER BY total_cost DESC
+"""
+
+# Con filtro de fechas se usan las llamadas individuales, ya que las fechas pueden
+# no coincidir con días completos
+COSTS_BY_SYMBOL_SQL = """
+    SELECT 
+        symbol,
+        COUNT(*) AS requests,
+        SUM(prompt_tokens)::BIGINT AS prompt_tokens,
+        SUM(completion_tokens)::BIGINT AS completion_tokens,
+        SUM(total_tokens)::BIGINT AS total_tokens,
+        SUM(prompt_cost) AS prompt_cost,
+        SUM(completion_cost) AS completion_cost,
+        SUM(total_cost) AS total_cost
+    FROM openai_costs
+    WHERE symbol != ''
+      AND ($1::TIMESTAMP IS NULL OR timestamp >= $1)
+      AND ($2::TIMESTAMP IS NULL OR timestamp <= $2)
+    GROUP BY symbol ORDER BY total_cost DESC
+"""
+
+TOTAL_COST_SQL = """
+    SELECT SUM(total_cost) FROM openai_costs
+    WHERE ($1::TIMESTAMP IS NULL OR timestamp >= $1)
+      AND ($2::TIMESTAMP IS NULL OR timestamp <= $2)
+"""
+
 class OpenAICostTracker:
     """Clase para el seguimiento y cálculo de costes de tokens de OpenAI."""
     
@@ -43,9 +253,25 @@ class OpenAICostTracker:
         self.data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
         self.db_path = os.path.join(self.data_dir, 'openai_costs.duckdb')
         
+        # Cursores libres para reutilizar entre consultas (también desde varios hilos)
+        self._cursor_pool = queue.SimpleQueue()
+        
         # Inicializar la base de datos
         self._init_database()
         
+        # Las filas se guardan en bloque desde un hilo escritor, fuera del camino de las
+        # llamadas a la API. Se vacía al consultar los costes o al salir (registrado después
+        # del cierre de la conexión, se ejecuta antes)
+        self._write_queue = queue.Queue()
+        self._max_batch = 1000
+        self._max_latency = 0.2
+        self._writer = threading.Thread(target=self._writer_loop, name='cost-writer', daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+        
+        # Contador para los IDs de las llamadas (único dentro del proceso)
+        self._counter = itertools.count()
+        
         # Precios por modelo (en USD por 1000 tokens)
         # Fuente: https://openai.com/pricing
         self.model_prices = {
@@ -63,22 +289,31 @@ class OpenAICostTracker:
             }
         }
         
+        # Precios por token ya divididos entre 1000, para no recalcularlos en cada llamada
+        self._input_price_per_token = {model: prices['input'] / 1000 for model, prices in self.model_prices.items()}
+        self._output_price_per_token = {model: prices['output'] / 1000 for model, prices in self.model_prices.items()}
+        
+        # Modelos sin precio conocido de los que ya se ha avisado
+        self._warned_models = set()
+        
         # Modelo por defecto
         self.default_model = self.openai_config.get('model', 'gpt-3.5-turbo')
         
-        # Inicializar codificador de tokens
-        self.tokenizers = {}
     
     def _init_database(self):
         """
         Inicializa la base de datos DuckDB para el seguimiento de costes.
         """
         try:
-            # Conectar a la base de datos
-            conn = duckdb.connect(self.db_path)
-            
-            # Crear tabla de costes si no existe
-            conn.execute("""
+            # Conexión única y duradera: cada operación usa su propio cursor sobre ella
+            self.conn = duckdb.connect(self.db_path)
+            atexit.register(self.conn.close)
+            
+            # Crear tabla de costes si no existe. Los tipos se mantienen a propósito: un
+            # USMALLINT se desborda con los contextos de 128k tokens, DECIMAL o micro-dólares
+            # en BIGINT ocupan lo mismo que DOUBLE, y en disco DuckDB ya comprime los tokens
+            # con bit-packing y los costes con ALP
+            self.conn.execute("""
                 CREATE TABLE IF NOT EXISTS openai_costs (
                     id VARCHAR PRIMARY KEY,
                     timestamp TIMESTAMP,
@@ -97,12 +332,31 @@ class OpenAICostTracker:
             """)
             
             # Crear índices para búsquedas eficientes
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_costs_timestamp ON openai_costs(timestamp)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_costs_symbol ON openai_costs(symbol)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_costs_model ON openai_costs(model)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_costs_timestamp ON openai_costs(timestamp)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_costs_symbol ON openai_costs(symbol)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_costs_model ON openai_costs(model)")
+            
+            # Costes agregados por día, empresa y modelo para los informes, que así no
+            # recorren todo el historial de llamadas
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS openai_costs_daily (
+                    date DATE,
+                    symbol VARCHAR,
+                    model VARCHAR,
+                    requests BIGINT,
+                    prompt_tokens BIGINT,
+                    completion_tokens BIGINT,
+                    total_tokens BIGINT,
+                    prompt_cost DOUBLE,
+                    completion_cost DOUBLE,
+                    total_cost DOUBLE,
+                    PRIMARY KEY (date, symbol, model)
+                )
+            """)
             
-            # Cerrar conexión
-            conn.close()
+            # Rellenar el agregado la primera vez a partir de las llamadas ya guardadas
+            if self.conn.execute("SELECT COUNT(*) FROM openai_costs_daily").fetchone()[0] == 0:
+                self.conn.execute(DAILY_AGGREGATE_SQL.format(source='openai_costs', where=''))
             
             logger.info("Base de datos de costes inicializada correctamente")
             
@@ -110,31 +364,27 @@ class OpenAICostTracker:
             logger.error(f"Error al inicializar la base de datos de costes: {str(e)}")
             raise
     
-    def _get_tokenizer(self, model):
+    @contextmanager
+    def _cursor(self):
         """
-        Obtiene el codificador de tokens para un modelo específico.
+        Presta un cursor de la conexión compartida y lo devuelve al terminar.
         
-        Args:
-            model (str): Nombre del modelo de OpenAI.
-            
-        Returns:
-            tiktoken.Encoding: Codificador de tokens para el modelo.
-        """
-        if model not in self.tokenizers:
-            try:
-                if model.startswith('gpt-4'):
-                    self.tokenizers[model] = tiktoken.encoding_for_model("gpt-4")
-                elif model.startswith('gpt-3.5'):
-                    self.tokenizers[model] = tiktoken.encoding_for_model("gpt-3.5-turbo")
-                else:
-                    # Modelo desconocido, usar cl100k_base como fallback
-                    self.tokenizers[model] = tiktoken.get_encoding("cl100k_base")
-            except Exception as e:
-                logger.error(f"Error al obtener tokenizer para {model}: {str(e)}")
-                # Usar cl100k_base como fallback
-                self.tokenizers[model] = tiktoken.get_encoding("cl100k_base")
+        Yields:
+            duckdb.DuckDBPyConnection: Cursor sobre la conexión compartida.
+        """
+        try:
+            cursor = self._cursor_pool.get_nowait()
+        except queue.Empty:
+            cursor = self.conn.cursor()
         
-        return self.tokenizers[model]
+        try:
+            yield cursor
+        except BaseException:
+            # Un cursor que ha fallado (p. ej. con una transacción abierta) no se reutiliza
+            cursor.close()
+            raise
+        
+        self._cursor_pool.put(cursor)
     
     def count_tokens(self, text, model=None):
         """
@@ -150,8 +400,17 @@ class OpenAICostTracker:
         if model is None:
             model = self.default_model
         
-        tokenizer = self._get_tokenizer(model)
-        return len(tokenizer.encode(text))
+        return _count_tokens_cached(model, [text])[text]
+    
+    def token_cache_info(self):
+        """
+        Obtiene las estadísticas de la caché de recuento de tokens.
+        
+        Returns:
+            dict: Aciertos, fallos, tamaño máximo y tamaño actual de la caché.
+        """
+        with _token_cache_lock:
+            return {**_token_cache_stats, 'maxsize': TOKEN_CACHE_SIZE, 'currsize': len(_token_cache)}
     
     def calculate_cost(self, prompt_tokens, completion_tokens, model=None):
         """
@@ -169,13 +428,16 @@ class OpenAICostTracker:
             model = self.default_model
         
         # Si el modelo no está en la lista de precios, usar gpt-3.5-turbo como fallback
-        if model not in self.model_prices:
-            logger.warning(f"Modelo {model} no encontrado en la lista de precios. Usando precios de gpt-3.5-turbo.")
+        # (avisando solo la primera vez)
+        if model not in self._input_price_per_token:
+            if model not in self._warned_models:
+                self._warned_models.add(model)
+                logger.warning(f"Modelo {model} no encontrado en la lista de precios. Usando precios de gpt-3.5-turbo.")
             model = 'gpt-3.5-turbo'
         
         # Calcular costes
-        prompt_cost = (prompt_tokens / 1000) * self.model_prices[model]['input']
-        completion_cost = (completion_tokens / 1000) * self.model_prices[model]['output']
+        prompt_cost = prompt_tokens * self._input_price_per_token[model]
+        completion_cost = completion_tokens * self._output_price_per_token[model]
         total_cost = prompt_cost + completion_cost
         
         return (prompt_cost, completion_cost, total_cost)
@@ -196,90 +458,232 @@ class OpenAICostTracker:
         Returns:
             dict: Información sobre la llamada y su coste.
         """
-        if model is None:
-            model = self.default_model
+        tracked = self.track_request_batch([{
+            'prompt': prompt,
+            'completion': completion,
+            'model': model,
+            'symbol': symbol,
+            'news_date': news_date,
+            'request_type': request_type,
+            'status': status
+        }])
+        
+        return tracked[0] if tracked else None
+    
+    def track_request_batch(self, records):
+        """
+        Registra varias llamadas a la API de OpenAI y las guarda en una sola transacción.
+        
+        Args:
+            records (list): Diccionarios con las claves de track_request ('prompt', 'completion'
+                            y, opcionalmente, 'model', 'symbol', 'news_date', 'request_type',
+                            'status' y 'timestamp' de la llamada).
+            
+        Returns:
+            list: Información sobre cada llamada registrada y su coste.
+        """
+        if not records:
+            return []
         
         try:
-            # Contar tokens
-            prompt_tokens = self.count_tokens(prompt, model)
-            completion_tokens = self.count_tokens(completion, model)
-            total_tokens = prompt_tokens + completion_tokens
-            
-            # Calcular costes
-            prompt_cost, completion_cost, total_cost = self.calculate_cost(prompt_tokens, completion_tokens, model)
-            
-            # Generar ID único
-            request_id = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{hash(prompt)}"
-            
-            # Preparar datos para guardar
-            data = {
-                'id': request_id,
-                'timestamp': datetime.now(),
-                'model': model,
-                'prompt_tokens': prompt_tokens,
-                'completion_tokens': completion_tokens,
-                'total_tokens': total_tokens,
-                'prompt_cost': prompt_cost,
-                'completion_cost': completion_cost,
-                'total_cost': total_cost,
-                'symbol': symbol if symbol else '',
-                'news_date': news_date if news_date else None,
-                'request_type': request_type,
-                'status': status
-            }
+            now = datetime.now()
+            token_counts = self._count_tokens_batch(records)
+            tracked = [self._build_request_data(record, now, token_counts) for record in records]
             
-            # Guardar en la base de datos
-            self._save_to_db(data)
+            # Encolar para que el hilo escritor lo guarde en bloque en la base de datos
+            self._write_queue.put(tracked)
             
             # Registrar en el log
-            logger.info(f"API call tracked: {total_tokens} tokens, ${total_cost:.6f} USD")
+            total_tokens = sum(data['total_tokens'] for data in tracked)
+            total_cost = sum(data['total_cost'] for data in tracked)
+            logger.info(f"API calls tracked: {len(tracked)} requests, {total_tokens} tokens, ${total_cost:.6f} USD")
             
-            return data
+            return tracked
             
         except Exception as e:
             logger.error(f"Error al registrar llamada a la API: {str(e)}")
-            return None
+            return []
     
-    def _save_to_db(self, data):
+    def _count_tokens_batch(self, records):
+        """
+        Cuenta los tokens de los prompts y respuestas de varias llamadas.
+        
+        Los textos distintos de cada modelo se buscan primero en la caché de
+        recuentos; los que faltan se codifican con una sola llamada a tiktoken,
+        que los procesa en paralelo fuera del GIL.
+        
+        Args:
+            records (list): Datos de las llamadas (ver track_request_batch).
+            
+        Returns:
+            dict: Número de tokens por texto, agrupado por modelo.
+        """
+        texts_by_model = {}
+        for record in records:
+            model = record.get('model') or self.default_model
+            texts = texts_by_model.setdefault(model, {})
+            texts[record['prompt']] = None
+            texts[record['completion']] = None
+        
+        return {model: _count_tokens_cached(model, list(texts)) for model, texts in texts_by_model.items()}
+    
+    def _build_request_data(self, record, now, token_counts):
+        """
+        Calcula los tokens y el coste de una llamada a la API.
+        
+        Args:
+            record (dict): Datos de la llamada (ver track_request_batch).
+            now (datetime): Momento del registro, usado si la llamada no trae 'timestamp'.
+            token_counts (dict): Tokens por texto y modelo (ver _count_tokens_batch).
+            
+        Returns:
+            dict: Fila con la información de la llamada y su coste.
+        """
+        model = record.get('model') or self.default_model
+        prompt = record['prompt']
+        symbol = record.get('symbol')
+        news_date = record.get('news_date')
+        timestamp = record.get('timestamp') or now
+        
+        # Contar tokens
+        prompt_tokens = token_counts[model][prompt]
+        completion_tokens = token_counts[model][record['completion']]
+        total_tokens = prompt_tokens + completion_tokens
+        
+        # Calcular costes
+        prompt_cost, completion_cost, total_cost = self.calculate_cost(prompt_tokens, completion_tokens, model)
+        
+        # Generar ID único sin recorrer el prompt: instante, proceso y contador
+        request_id = f"{timestamp.timestamp():.6f}_{os.getpid()}_{next(self._counter)}"
+        
+        return {
+            'id': request_id,
+            'timestamp': timestamp,
+            'model': model,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': total_tokens,
+            'prompt_cost': prompt_cost,
+            'completion_cost': completion_cost,
+            'total_cost': total_cost,
+            'symbol': symbol if symbol else '',
+            'news_date': news_date if news_date else None,
+            'request_type': record.get('request_type', "sentiment_analysis"),
+            'status': record.get('status', "success")
+        }
+    
+    def _writer_loop(self):
+        """
+        Hilo escritor: agrupa las filas encoladas y las guarda en bloque.
+        
+        Cada lote se cierra al reunir max_batch filas, al pasar max_latency segundos
+        desde la primera o al recibir una petición de flush.
+        """
+        while True:
+            item = self._write_queue.get()
+            rows = []
+            flush_events = []
+            deadline = time.monotonic() + self._max_latency
+            
+            while True:
+                if isinstance(item, threading.Event):
+                    flush_events.append(item)
+                else:
+                    rows.extend(item)
+                
+                remaining = deadline - time.monotonic()
+                if flush_events or len(rows) >= self._max_batch or remaining <= 0:
+                    break
+                
+                try:
+                    item = self._write_queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            
+            if rows:
+                self._save_to_db(rows)
+            
+            for event in flush_events:
+                event.set()
+    
+    def flush(self):
+        """
+        Espera a que se guarden en la base de datos las llamadas registradas pendientes.
+        """
+        if not self._writer.is_alive():
+            # Sin hilo escritor (p. ej. en un proceso hijo creado con fork): guardar aquí
+            rows = []
+            while True:
+                try:
+                    item = self._write_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if not isinstance(item, threading.Event):
+                    rows.extend(item)
+            
+            if rows:
+                self._save_to_db(rows)
+            return
+        
+        done = threading.Event()
+        self._write_queue.put(done)
+        done.wait()
+    
+    def _save_to_db(self, rows):
         """
         Guarda información de coste en la base de datos.
         
         Args:
-            data (dict): Datos a guardar.
+            rows (list): Filas a guardar.
         """
         try:
-            # Conectar a la base de datos
-            conn = duckdb.connect(self.db_path)
-            
-            # Insertar datos
-            conn.execute("""
-                INSERT INTO openai_costs 
-                (id, timestamp, model, prompt_tokens, completion_tokens, total_tokens, 
-                prompt_cost, completion_cost, total_cost, symbol, news_date, request_type, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                data['id'],
-                data['timestamp'],
-                data['model'],
-                data['prompt_tokens'],
-                data['completion_tokens'],
-                data['total_tokens'],
-                data['prompt_cost'],
-                data['completion_cost'],
-                data['total_cost'],
-                data['symbol'],
-                data['news_date'],
-                data['request_type'],
-                data['status']
-            ))
-            
-            # Cerrar conexión
-            conn.close()
+            costs_df = pd.DataFrame(rows, columns=COST_COLUMNS)
+            
+            with self._cursor() as conn:
+                conn.register('costs_batch', costs_df)
+                conn.execute("BEGIN TRANSACTION")
+                
+                # Insertar todas las filas en bloque, sin pasar por el parser de SQL fila a fila.
+                # Un ID repetido no debe hacer perder el resto del lote
+                inserted_ids = [row_id for row_id, in conn.execute(f"""
+                    INSERT INTO openai_costs ({', '.join(COST_COLUMNS)})
+                    SELECT * FROM costs_batch
+                    ON CONFLICT DO NOTHING
+                    RETURNING id
+                """).fetchall()]
+                
+                # Sumar al agregado diario solo las filas realmente insertadas
+                if inserted_ids:
+                    conn.execute(
+                        DAILY_AGGREGATE_SQL.format(source='costs_batch', where='WHERE id = ANY(?)'),
+                        [inserted_ids]
+                    )
+                
+                conn.execute("COMMIT")
+                conn.unregister('costs_batch')
             
         except Exception as e:
             logger.error(f"Error al guardar datos de coste en la base de datos: {str(e)}")
     
-    def get_costs_summary(self, start_date=None, end_date=None, symbol=None, model=None):
+    def _fetch_costs(self, query, params, as_arrow):
+        """
+        Ejecuta una consulta de costes exportando el resultado en columnas Arrow.
+        
+        Args:
+            query (str): Consulta SQL.
+            params (list): Parámetros de la consulta.
+            as_arrow (bool): Si es True, devuelve la tabla Arrow; si no, un DataFrame.
+            
+        Returns:
+            pandas.DataFrame | pyarrow.Table: Resultado de la consulta.
+        """
+        with self._cursor() as conn:
+            table = conn.execute(query, params).fetch_arrow_table()
+        
+        # Las fechas se convierten a datetime64, como hacía fetchdf()
+        return table if as_arrow else table.to_pandas(date_as_object=False)
+    
+    def get_costs_summary(self, start_date=None, end_date=None, symbol=None, model=None, as_arrow=False):
         """
         Obtiene un resumen de costes de la API de OpenAI.
         
@@ -288,153 +692,69 @@ class OpenAICostTracker:
             end_date (datetime, optional): Fecha de fin para filtrar.
             symbol (str, optional): Símbolo de empresa para filtrar.
             model (str, optional): Modelo para filtrar.
+            as_arrow (bool, optional): Si es True, devuelve la tabla Arrow sin convertir a pandas.
             
         Returns:
-            pandas.DataFrame: DataFrame con el resumen de costes.
+            pandas.DataFrame | pyarrow.Table: Resumen de costes.
         """
+        # Incluir las llamadas aún no guardadas
+        self.flush()
+        
         try:
-            # Conectar a la base de datos
-            conn = duckdb.connect(self.db_path)
-            
-            # Construir consulta
-            query = "SELECT * FROM openai_costs WHERE 1=1"
-            params = []
-            
-            if start_date:
-                query += " AND timestamp >= ?"
-                params.append(start_date)
-            
-            if end_date:
-                query += " AND timestamp <= ?"
-                params.append(end_date)
-            
-            if symbol:
-                query += " AND symbol = ?"
-                params.append(symbol)
-            
-            if model:
-                query += " AND model = ?"
-                params.append(model)
-            
-            # Ejecutar consulta
-            if params:
-                df = conn.execute(query, params).fetchdf()
-            else:
-                df = conn.execute(query).fetchdf()
-            
-            # Cerrar conexión
-            conn.close()
-            
-            return df
+            params = [start_date or None, end_date or None, symbol or None, model or None]
+            return self._fetch_costs(COSTS_SUMMARY_SQL, params, as_arrow)
             
         except Exception as e:
             logger.error(f"Error al obtener resumen de costes: {str(e)}")
-            return pd.DataFrame()
+            return pa.table({}) if as_arrow else pd.DataFrame()
     
-    def get_daily_costs(self, days=30, symbol=None):
+    def get_daily_costs(self, days=30, symbol=None, as_arrow=False):
         """
         Obtiene un resumen de costes diarios.
         
         Args:
             days (int, optional): Número de días a incluir.
             symbol (str, optional): Símbolo de empresa para filtrar.
+            as_arrow (bool, optional): Si es True, devuelve la tabla Arrow sin convertir a pandas.
             
         Returns:
-            pandas.DataFrame: DataFrame con costes diarios.
+            pandas.DataFrame | pyarrow.Table: Costes diarios.
         """
+        # Incluir las llamadas aún no guardadas
+        self.flush()
+        
         try:
-            # Conectar a la base de datos
-            conn = duckdb.connect(self.db_path)
-            
-            # Construir consulta
-            query = """
-                SELECT 
-                    DATE_TRUNC('day', timestamp) AS date,
-                    COUNT(*) AS requests,
-                    SUM(prompt_tokens) AS prompt_tokens,
-                    SUM(completion_tokens) AS completion_tokens,
-                    SUM(total_tokens) AS total_tokens,
-                    SUM(prompt_cost) AS prompt_cost,
-                    SUM(completion_cost) AS completion_cost,
-                    SUM(total_cost) AS total_cost
-                FROM openai_costs
-                WHERE timestamp >= CURRENT_DATE - INTERVAL ? DAY
-            """
-            params = [days]
-            
-            if symbol:
-                query += " AND symbol = ?"
-                params.append(symbol)
-            
-            query += " GROUP BY DATE_TRUNC('day', timestamp) ORDER BY date DESC"
-            
-            # Ejecutar consulta
-            df = conn.execute(query, params).fetchdf()
-            
-            # Cerrar conexión
-            conn.close()
-            
-            return df
+            return self._fetch_costs(DAILY_COSTS_SQL, [days, symbol or None], as_arrow)
             
         except Exception as e:
             logger.error(f"Error al obtener costes diarios: {str(e)}")
-            return pd.DataFrame()
+            return pa.table({}) if as_arrow else pd.DataFrame()
     
-    def get_costs_by_symbol(self, start_date=None, end_date=None):
+    def get_costs_by_symbol(self, start_date=None, end_date=None, as_arrow=False):
         """
         Obtiene un resumen de costes por símbolo de empresa.
         
         Args:
             start_date (datetime, optional): Fecha de inicio para filtrar.
             end_date (datetime, optional): Fecha de fin para filtrar.
+            as_arrow (bool, optional): Si es True, devuelve la tabla Arrow sin convertir a pandas.
             
         Returns:
-            pandas.DataFrame: DataFrame con costes por símbolo.
+            pandas.DataFrame | pyarrow.Table: Costes por símbolo.
         """
+        # Incluir las llamadas aún no guardadas
+        self.flush()
+        
         try:
-            # Conectar a la base de datos
-            conn = duckdb.connect(self.db_path)
-            
-            # Construir consulta
-            query = """
-                SELECT 
-                    symbol,
-                    COUNT(*) AS requests,
-                    SUM(prompt_tokens) AS prompt_tokens,
-                    SUM(completion_tokens) AS completion_tokens,
-                    SUM(total_tokens) AS total_tokens,
-                    SUM(prompt_cost) AS prompt_cost,
-                    SUM(completion_cost) AS completion_cost,
-                    SUM(total_cost) AS total_cost
-                FROM openai_costs
-                WHERE symbol != ''
-            """
-            params = []
-            
-            if start_date:
-                query += " AND timestamp >= ?"
-                params.append(start_date)
-            
-            if end_date:
-                query += " AND timestamp <= ?"
-                params.append(end_date)
-            
-            query += " GROUP BY symbol ORDER BY total_cost DESC"
-            
-            # Ejecutar consulta
-            if params:
-                df = conn.execute(query, params).fetchdf()
-            else:
-                df = conn.execute(query).fetchdf()
-            
-            # Cerrar conexión
-            conn.close()
-            
-            return df
+            if start_date is None and end_date is None:
+                return self._fetch_costs(COSTS_BY_SYMBOL_DAILY_SQL, [], as_arrow)
+            
+            params = [start_date or None, end_date or None]
+            return self._fetch_costs(COSTS_BY_SYMBOL_SQL, params, as_arrow)
             
         except Exception as e:
             logger.error(f"Error al obtener costes por símbolo: {str(e)}")
-            return pd.DataFrame()
+            return pa.table({}) if as_arrow else pd.DataFrame()
     
     def get_total_cost(self, start_date=None, end_date=None):
         """
@@ -447,30 +767,12 @@ class OpenAICostTracker:
         Returns:
             float: Coste total en USD.
         """
+        # Incluir las llamadas aún no guardadas
+        self.flush()
+        
         try:
-            # Conectar a la base de datos
-            conn = duckdb.connect(self.db_path)
-            
-            # Construir consulta
-            query = "SELECT SUM(total_cost) FROM openai_costs WHERE 1=1"
-            params = []
-            
-            if start_date:
-                query += " AND timestamp >= ?"
-                params.append(start_date)
-            
-            if end_date:
-                query += " AND timestamp <= ?"
-                params.append(end_date)
-            
-            # Ejecutar consulta
-            if params:
-                result = conn.execute(query, params).fetchone()
-            else:
-                result = conn.execute(query).fetchone()
-            
-            # Cerrar conexión
-            conn.close()
+            with self._cursor() as conn:
+                result = conn.execute(TOTAL_COST_SQL, [start_date or None, end_date or None]).fetchone()
             
             return result[0] if result[0] is not None else 0.0
             
@@ -478,6 +780,27 @@ class OpenAICostTracker:
             logger.error(f"Error al obtener coste total: {str(e)}")
             return 0.0
     
+    @staticmethod
+    def _markdown_table(header, labels, df):
+        """
+        Construye una tabla markdown completa en un único string.
+        
+        Las columnas se formatean de forma vectorizada y se unen con un solo
+        join, en lugar de formatear y escribir fila a fila.
+        
+        Args:
+            header (str): Cabecera y separador de la tabla.
+            labels (pd.Series): Primera columna ya formateada (empresa o fecha).
+            df (pd.DataFrame): Datos con columnas requests, total_tokens y total_cost.
+            
+        Returns:
+            str: Tabla markdown terminada en salto de línea.
+        """
+        rows = ("| " + labels + " | " + df['requests'].astype(str) + " | "
+                + df['total_tokens'].astype(str) + " | $"
+                + df['total_cost'].map('{:.4f}'.format) + " |")
+        return header + "\n" + "\n".join(rows.tolist()) + "\n"
+    
     def generate_cost_report(self, output_file=None):
         """
         Genera un informe detallado de costes.
@@ -519,20 +842,23 @@ class OpenAICostTracker:
                 
                 f.write("## Costes por Empresa\n\n")
                 if not costs_by_symbol.empty:
-                    f.write("| Empresa | Solicitudes | Tokens | Coste (USD) |\n")
-                    f.write("|---------|-------------|--------|-------------|\n")
-                    for _, row in costs_by_symbol.iterrows():
-                        f.write(f"| {row['symbol']} | {row['requests']} | {row['total_tokens']} | ${row['total_cost']:.4f} |\n")
+                    f.write(self._markdown_table(
+                        "| Empresa | Solicitudes | Tokens | Coste (USD) |\n"
+                        "|---------|-------------|--------|-------------|",
+                        costs_by_symbol['symbol'].astype(str),
+                        costs_by_symbol
+                    ))
                 else:
                     f.write("No hay datos disponibles por empresa.\n")
                 
                 f.write("\n## Costes Diarios (Últimos 30 días)\n\n")
                 if not daily_costs.empty:
-                    f.write("| Fecha | Solicitudes | Tokens | Coste (USD) |\n")
-                    f.write("|-------|-------------|--------|-------------|\n")
-                    for _, row in daily_costs.iterrows():
-                        date_str = row['date'].strftime('%Y-%m-%d') if isinstance(row['date'], datetime) else str(row['date'])
-                        f.write(f"| {date_str} | {row['requests']} | {row['total_tokens']} | ${row['total_cost']:.4f} |\n")
+                    f.write(self._markdown_table(
+                        "| Fecha | Solicitudes | Tokens | Coste (USD) |\n"
+                        "|-------|-------------|--------|-------------|",
+                        pd.to_datetime(daily_costs['date']).dt.strftime('%Y-%m-%d'),
+                        daily_costs
+                    ))
                 else:
                     f.write("No hay datos disponibles para los últimos 30 días.\n")
                 
@@ -548,8 +874,28 @@ class OpenAICostTracker:
             logger.error(f"Error al generar informe de costes: {str(e)}")
             return None
 
-# Instancia global para uso en todo el proyecto
-cost_tracker = OpenAICostTracker()
+# Instancia compartida del seguimiento de costes y cerrojo para crearla una sola vez
+_cost_tracker = None
+_cost_tracker_lock = threading.Lock()
+
+def get_cost_tracker():
+    """
+    Obtiene la instancia compartida del seguimiento de costes, creándola al primer uso.
+    
+    No se crea al importar el módulo: la instancia abre (y bloquea) el archivo DuckDB
+    y arranca el hilo escritor, y los procesos trabajadores que reimportan los módulos
+    del proyecto no deben hacerlo. La creación va bajo un cerrojo porque las empresas
+    se analizan en varios hilos y dos instancias crearían las tablas a la vez.
+    
+    Returns:
+        OpenAICostTracker: Seguimiento de costes del proceso.
+    """
+    global _cost_tracker
+    
+    with _cost_tracker_lock:
+        if _cost_tracker is None:
+            _cost_tracker = OpenAICostTracker()
+        return _cost_tracker
 
 if __name__ == "__main__":
     # Ejemplo de uso
@@ -22,13 +22,19 @@ import matplotlib.ticker as mtick
 class ResultsVisualizer:
     """Clase para visualizar los resultados del análisis de sentimiento y correlación."""
     
-    def __init__(self, config_path):
+    def __init__(self, config_path=None):
         """
         Inicializa el visualizador de resultados.
         
         Args:
             config_path (str): Ruta al archivo de configuración YAML.
         """
+        if config_path is None:
+            config_path = os.path.join(
+                os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                'config',
+                'config.yaml'
+            )
         self.config = self._load_config(config_path)
         self.data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
         self.results_dir = os.path.join(self.data_dir, 'results')
@@ -65,32 +71,48 @@ class ResultsVisualizer:
         results = {}
         
         for company in self.config['companies']:
-            symbol = company['symbol']
-            name = company['name']
+            visualization_paths = self.visualize_company(company)
             
-            print(f"Generando visualizaciones para {name} ({symbol})...")
-            
-            try:
-                # Cargar datos de sentimiento
-                sentiment_data = self._load_sentiment_data(symbol)
-                
-                if sentiment_data is not None:
-                    # Generar visualizaciones
-                    visualization_paths = self._generate_visualizations(sentiment_data, symbol, name)
-                    results[symbol] = visualization_paths
-                
-            except Exception as e:
-                print(f"Error al generar visualizaciones para {symbol}: {str(e)}")
+            if visualization_paths is not None:
+                results[company['symbol']] = visualization_paths
         
         # Generar visualización comparativa de todas las empresas
         try:
-            comparative_path = self._generate_comparative_visualization()
+            comparative_path = self.generate_comparative_visualization()
             results['comparative'] = comparative_path
         except Exception as e:
             print(f"Error al generar visualización comparativa: {str(e)}")
         
         return results
     
+    def visualize_company(self, company):
+        """
+        Genera las visualizaciones de una empresa.
+        
+        Args:
+            company (dict): Empresa con 'symbol' y 'name'.
+            
+        Returns:
+            dict: Rutas a las visualizaciones generadas, o None si no hay datos.
+        """
+        symbol = company['symbol']
+        name = company['name']
+        
+        print(f"Generando visualizaciones para {name} ({symbol})...")
+        
+        try:
+            # Cargar datos de sentimiento
+            sentiment_data = self._load_sentiment_data(symbol)
+            
+            if sentiment_data is not None:
+                # Generar visualizaciones
+                return self._generate_visualizations(sentiment_data, symbol, name)
+            
+        except Exception as e:
+            print(f"Error al generar visualizaciones para {symbol}: {str(e)}")
+        
+        return None
+    
     def _load_sentiment_data(self, symbol):
         """
         Carga los datos de sentimiento.
@@ -464,7 +486,7 @@ class ResultsVisualizer:
         
         return output_path
     
-    def _generate_comparative_visualization(self):
+    def generate_comparative_visualization(self):
         """
         Genera una visualización comparativa de todas las empresas.
         
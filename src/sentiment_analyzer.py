@@ -7,9 +7,11 @@ Utiliza NLTK y TextBlob para analizar el sentimiento de las noticias.
 """
 
 import os
+import re
 import sys
 import yaml
 import json
+import pickle
 import pandas as pd
 import numpy as np
 from datetime import datetime
@@ -18,24 +20,130 @@ from nltk.sentiment.vader import SentimentIntensityAnalyzer
 from textblob import TextBlob
 import telegram
 
+# Caché local: el centinela indica que los recursos de NLTK ya se verificaron
+NLTK_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'sentimiento')
+NLTK_SENTINEL = os.path.join(NLTK_CACHE_DIR, 'nltk_ready')
+
+_NLTK_READY = False
+
+# Analizador VADER compartido por todas las instancias del proceso
+_VADER = None
+
+# VADER se degrada mucho con textos cargados de emojis: por encima de este
+# número se eliminan antes de puntuar
+MAX_EMOJIS = 50
+EMOJI_PATTERN = re.compile(r'[\U0001F300-\U0001FAFF\U0001F600-\U0001F64F\u2600-\u27BF]')
+
+
+def _ensure_nltk():
+    """
+    Descarga los recursos de NLTK la primera vez que se necesitan.
+    
+    Tras una verificación correcta se crea un fichero centinela, de modo que
+    los procesos siguientes no repiten la búsqueda en disco.
+    """
+    global _NLTK_READY
+    if _NLTK_READY or os.path.exists(NLTK_SENTINEL):
+        _NLTK_READY = True
+        return
+    
+    try:
+        nltk.data.find('sentiment/vader_lexicon.zip')
+    except LookupError:
+        if not nltk.download('vader_lexicon', quiet=True):
+            print("Error al descargar el léxico de VADER")
+            return
+    
+    try:
+        os.makedirs(NLTK_CACHE_DIR, exist_ok=True)
+        open(NLTK_SENTINEL, 'w').close()
+    except OSError:
+        pass
+    _NLTK_READY = True
+
+
+def _load_vader():
+    """
+    Carga el analizador VADER reutilizando el léxico ya parseado en disco.
+    
+    Returns:
+        SentimentIntensityAnalyzer: Analizador con el léxico cargado.
+    """
+    # El léxico serializado depende de la versión de NLTK que lo generó
+    cache_path = os.path.join(NLTK_CACHE_DIR, f"vader_{nltk.__version__}.pkl")
+    try:
+        with open(cache_path, 'rb') as file:
+            return pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+        pass
+    
+    sia = SentimentIntensityAnalyzer()
+    
+    # Escritura atómica para que otro proceso nunca lea un fichero a medias
+    try:
+        os.makedirs(NLTK_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            pickle.dump(sia, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+    return sia
+
+
+def _get_vader():
+    """
+    Devuelve el analizador VADER del proceso, creándolo la primera vez.
+    
+    Returns:
+        SentimentIntensityAnalyzer: Analizador con el léxico cargado.
+    """
+    global _VADER
+    if _VADER is None:
+        _ensure_nltk()
+        _VADER = _load_vader()
+    return _VADER
+
+
+def _guard_vader_text(text):
+    """
+    Elimina los emojis de los textos que tienen demasiados para VADER.
+    
+    Args:
+        text (str): Texto a puntuar.
+        
+    Returns:
+        str: Texto seguro para VADER.
+    """
+    if len(EMOJI_PATTERN.findall(text)) > MAX_EMOJIS:
+        return EMOJI_PATTERN.sub('', text)
+    return text
+
+
 class SentimentAnalyzer:
     """Clase para analizar el sentimiento de noticias."""
     
-    def __init__(self, config_path):
+    def __init__(self, config_path=None):
         """
         Inicializa el analizador de sentimiento.
         
         Args:
             config_path (str): Ruta al archivo de configuración YAML.
         """
+        if config_path is None:
+            config_path = os.path.join(
+                os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                'config',
+                'config.yaml'
+            )
         self.config = self._load_config(config_path)
         self.data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
         self.processed_dir = os.path.join(self.data_dir, 'processed')
         self.results_dir = os.path.join(self.data_dir, 'results')
         os.makedirs(self.results_dir, exist_ok=True)
         
-        # Inicializar analizadores de sentimiento
-        self.sia = SentimentIntensityAnalyzer()
+        # Inicializar analizadores de sentimiento (NLTK solo se prepara al usarse)
+        self.sia = _get_vader()
         
         # Configurar niveles de sentimiento
         self.sentiment_levels = 5  # Muy malo, malo, neutro, bueno, muy bueno
@@ -82,27 +190,45 @@ class SentimentAnalyzer:
         results = {}
         
         for company in self.config['companies']:
-            symbol = company['symbol']
-            name = company['name']
+            sentiment_data = self.analyze_company(company)
             
-            print(f"Analizando sentimiento para {name} ({symbol})...")
+            if sentiment_data is not None:
+                results[company['symbol']] = sentiment_data
+        
+        return results
+    
+    def analyze_company(self, company):
+        """
+        Analiza el sentimiento de una empresa.
+        
+        Args:
+            company (dict): Empresa con 'symbol' y 'name'.
             
-            try:
-                # Cargar datos combinados
-                combined_data = self._load_combined_data(symbol)
+        Returns:
+            pandas.DataFrame: Datos con el sentimiento analizado, o None si no hay datos.
+        """
+        symbol = company['symbol']
+        name = company['name']
+        
+        print(f"Analizando sentimiento para {name} ({symbol})...")
+        
+        try:
+            # Cargar datos combinados
+            combined_data = self._load_combined_data(symbol)
+            
+            if combined_data is not None:
+                # Analizar sentimiento
+                sentiment_data = self._analyze_sentiment(combined_data, symbol)
                 
-                if combined_data is not None:
-                    # Analizar sentimiento
-                    sentiment_data = self._analyze_sentiment(combined_data, symbol)
-                    results[symbol] = sentiment_data
-                    
-                    # Enviar resumen por Telegram
-                    self._send_sentiment_summary(sentiment_data, symbol, name)
+                # Enviar resumen por Telegram
+                self._send_sentiment_summary(sentiment_data, symbol, name)
                 
-            except Exception as e:
-                print(f"Error al analizar sentimiento para {symbol}: {str(e)}")
+                return sentiment_data
+            
+        except Exception as e:
+            print(f"Error al analizar sentimiento para {symbol}: {str(e)}")
         
-        return results
+        return None
     
     def _load_combined_data(self, symbol):
         """
@@ -114,14 +240,14 @@ class SentimentAnalyzer:
         Returns:
             pandas.DataFrame: DataFrame con datos combinados.
         """
-        file_path = os.path.join(self.processed_dir, f"{symbol}_combined.csv")
+        file_path = os.path.join(self.processed_dir, f"{symbol}_combined.parquet")
         
         if not os.path.exists(file_path):
             print(f"No se encontraron datos combinados para {symbol}")
             return None
         
         # Cargar datos
-        df = pd.read_csv(file_path, index_col=0, parse_dates=True)
+        df = pd.read_parquet(file_path, engine='pyarrow')
         
         return df
     
@@ -149,7 +275,7 @@ class SentimentAnalyzer:
         for idx, row in sentiment_df.iterrows():
             if row['content'] and isinstance(row['content'], str):
                 # Análisis con VADER
-                vader_scores = self.sia.polarity_scores(row['content'])
+                vader_scores = self.sia.polarity_scores(_guard_vader_text(row['content']))
                 vader_compound = vader_scores['compound']
                 
                 # Análisis con TextBlob
@@ -18,13 +18,19 @@ from scipy import stats
 class SentimentPriceCorrelator:
     """Clase para analizar la correlación entre sentimiento y movimientos de precios."""
     
-    def __init__(self, config_path):
+    def __init__(self, config_path=None):
         """
         Inicializa el correlador de sentimiento y precios.
         
         Args:
             config_path (str): Ruta al archivo de configuración YAML.
         """
+        if config_path is None:
+            config_path = os.path.join(
+                os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                'config',
+                'config.yaml'
+            )
         self.config = self._load_config(config_path)
         self.data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
         self.results_dir = os.path.join(self.data_dir, 'results')
@@ -57,25 +63,41 @@ class SentimentPriceCorrelator:
         results = {}
         
         for company in self.config['companies']:
-            symbol = company['symbol']
-            name = company['name']
-            
-            print(f"Analizando correlación para {name} ({symbol})...")
+            correlation_results = self.analyze_company(company)
             
-            try:
-                # Cargar datos de sentimiento
-                sentiment_data = self._load_sentiment_data(symbol)
-                
-                if sentiment_data is not None:
-                    # Analizar correlación
-                    correlation_results = self._analyze_correlation(sentiment_data, symbol, name)
-                    results[symbol] = correlation_results
-                
-            except Exception as e:
-                print(f"Error al analizar correlación para {symbol}: {str(e)}")
+            if correlation_results is not None:
+                results[company['symbol']] = correlation_results
         
         return results
     
+    def analyze_company(self, company):
+        """
+        Analiza la correlación entre sentimiento y precios de una empresa.
+        
+        Args:
+            company (dict): Empresa con 'symbol' y 'name'.
+            
+        Returns:
+            dict: Resultados del análisis de correlación, o None si no hay datos.
+        """
+        symbol = company['symbol']
+        name = company['name']
+        
+        print(f"Analizando correlación para {name} ({symbol})...")
+        
+        try:
+            # Cargar datos de sentimiento
+            sentiment_data = self._load_sentiment_data(symbol)
+            
+            if sentiment_data is not None:
+                # Analizar correlación
+                return self._analyze_correlation(sentiment_data, symbol, name)
+            
+        except Exception as e:
+            print(f"Error al analizar correlación para {symbol}: {str(e)}")
+        
+        return None
+    
     def _load_sentiment_data(self, symbol):
         """
         Carga los datos de sentimiento.
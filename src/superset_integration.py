@@ -20,7 +20,7 @@ import yaml
 # Importar módulos del proyecto
 from config_manager import config_manager
 from news_database import NewsDatabase
-from openai_cost_tracker import cost_tracker
+from openai_cost_tracker import get_cost_tracker
 
 # Configurar logging
 logging.basicConfig(
@@ -140,11 +140,11 @@ class SupersetIntegration:
                 symbol = company['symbol']
                 
                 # Cargar datos de sentimiento
-                sentiment_path = os.path.join(self.data_dir, 'results', f"{symbol}_sentiment_chatgpt.csv")
+                sentiment_path = os.path.join(self.data_dir, 'results', f"{symbol}_sentiment_chatgpt.parquet")
                 
                 if os.path.exists(sentiment_path):
                     # Cargar datos
-                    df = pd.read_csv(sentiment_path, index_col=0, parse_dates=True)
+                    df = pd.read_parquet(sentiment_path, engine='pyarrow')
                     
                     # Añadir columna de símbolo
                     df['symbol'] = symbol
@@ -187,7 +187,7 @@ class SupersetIntegration:
             engine = create_engine(self.connection_string)
             
             # Obtener datos de costes
-            costs_df = cost_tracker.get_costs_summary()
+            costs_df = get_cost_tracker().get_costs_summary()
             
             if not costs_df.empty:
                 # Guardar en la base de datos